@@ -85,6 +85,8 @@ class Pick(Action):
 
         agent.inventory.add(waste)
         model.grid.remove_agent(waste)
+        model.n_wastes_on_grid[waste.color] -= 1
+        model.n_wastes_in_inventory[waste.color] += 1
 
     def can_apply(self, model: "RobotMission", agent: "Agent") -> bool:
         if agent.inventory.is_full():
@@ -110,6 +112,8 @@ class Drop(Action):
             model.dump_waste(self.waste)
         else:
             model.grid.place_agent(self.waste, pos)
+            model.n_wastes_in_inventory[self.waste.color] -= 1
+            model.n_wastes_on_grid[self.waste.color] += 1
 
     def can_apply(self, model: "RobotMission", agent: "Agent") -> bool:
         if self.waste not in agent.inventory:
@@ -132,6 +136,8 @@ class Merge(Action):
 
         new_waste = Waste(model, Color(self.waste1.color.value + 1))
         agent.inventory.add(new_waste)
+        model.n_wastes_in_inventory[self.waste1.color] -= 2
+        model.n_wastes_in_inventory[new_waste.color] += 1
 
     def can_apply(self, model: "RobotMission", agent: "Agent") -> bool:
         if self.waste1 not in agent.inventory or self.waste2 not in agent.inventory:
@@ -103,7 +103,9 @@ class CommunicationAgent(Agent):
     def __init__(self, model: "RobotMission", color: Color) -> None:
         super().__init__(model, color)
         self.mailbox = Mailbox()
-        apaci = AllPositionsAndColorsInformation()
+        apaci = AllPositionsAndColorsInformation(
+            model.message_service.channel(ContentType.ID_POSITION_COLOR, delay=model.communication_delay)
+        )
         ti = TargetInformation()
         dico = {
             "AllPositionsAndColorsInformation": apaci,
@@ -114,28 +116,33 @@ class CommunicationAgent(Agent):
         self.target = None
 
     def send_messages(self) -> None:
-        # We send our position and color to everyone
-        content_type = ContentType.ID_POSITION_COLOR
-        readable_data = [self.unique_id, self.get_true_pos(), self.color]
-        message = readable_data_to_message(readable_data, content_type)
-        agent_ids = [agent.unique_id for agent in self.model.get_agents()]
-        self.model.message_service.send_all(agent_ids, message)
+        # We publish our position and color to everyone
+        self.model.message_service.publish(ContentType.ID_POSITION_COLOR, self.unique_id, (self.get_true_pos(), self.color))
 
         # We send our target to the next agent
         if self.target is not None:
             content_type = ContentType.TARGET
             readable_data = self.target
             message = readable_data_to_message(readable_data, content_type)
-            possible_agents = {}
 
-            positions_and_colors_info = self.information.informations["AllPositionsAndColorsInformation"]
-            assert isinstance(positions_and_colors_info, AllPositionsAndColorsInformation)
-
-            for agent_id in positions_and_colors_info.positions.keys():
-                color = positions_and_colors_info.colors[agent_id]
-                if color == self.color + 1:
-                    possible_agents[agent_id] = positions_and_colors_info.positions[agent_id]
-            receiver_id = get_closest_agent(self.get_true_pos()[0], self.get_true_pos()[1], possible_agents)
+            if self.model.communication_delay == 0:
+                # The index holds the same positions as our information, without the delay
+                receiver_id = self.model.message_service.position_index.nearest(self.get_true_pos(), Color(self.color + 1))
+            else:
+                positions_and_colors_info = self.information.informations["AllPositionsAndColorsInformation"]
+                assert isinstance(positions_and_colors_info, AllPositionsAndColorsInformation)
+
+                possible_agents = {}
+                for agent_id, (position, color) in positions_and_colors_info.positions_and_colors.items():
+                    if color == self.color + 1:
+                        possible_agents[agent_id] = position
+                receiver_id = None
+                if possible_agents:
+                    receiver_id = get_closest_agent(self.get_true_pos()[0], self.get_true_pos()[1], possible_agents)
+
+            if receiver_id is None:
+                # No agent of the next color is known (yet), we keep the target and send it on a later step
+                return
             self.model.message_service.send(receiver_id, message)
             self.target = None
 
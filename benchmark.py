@@ -4,50 +4,96 @@ Members: Aymeric Conti, Pierre Jourdin
 Date: 21/03/2025
 """
 
-import matplotlib.pyplot as plt
+import os
+import torch
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import Any
 
 from tqdm import tqdm
-from run import model, reset_model
+from model import RobotMission
 from utils import Color
 
 
-def count_wastes(state: dict[str, Any]) -> int:
-    count = len(state["wastes"])
-    for agent in state["agents"]:
-        count += len(agent["inventory"])
-    return count
+default_benchmark_params: dict[str, Any] = {"n_green_agents": 3, "n_yellow_agents": 2, "n_red_agents": 2}
 
 
-def update_curve(history: list[dict[str, Any]], curve: list[int]) -> None:
-    for i, h in enumerate(history):
-        curve[i] += count_wastes(h)
-
-
-def play(agents_model: str, curve: list[int], steps: int) -> None:
-    reset_model(
-        n_green_agents=3,
-        n_yellow_agents=2,
-        n_red_agents=2,
+def play(agents_model: str, steps: int, seed: int, **model_params: Any) -> list[int]:
+    """Runs one game and returns the number of wastes left after each step."""
+    model = RobotMission(
+        seed=seed,
         **{f"{color.name.lower()}_agent_model": agents_model for color in Color},
+        **(default_benchmark_params | model_params),
     )
-    model.value.run(steps)
-    update_curve(model.value.history, curve)
-
 
-def benchmark(agents_model: str, n_run: int = 1000, steps: int = 400) -> list[float]:
     curve = [0] * steps
+    for i in range(steps):
+        if model.is_done():
+            break
+        model.step()
+        curve[i] = sum(model.get_n_wastes(color) for color in Color)
 
-    for _ in tqdm(range(n_run)):
-        play(agents_model, curve, steps)
+    return curve
 
-    return [c / n_run for c in curve]
+
+def play_runs(agents_model: str, seeds: list[int], steps: int, model_params: dict[str, Any]) -> list[int]:
+    """Runs several games in a worker and returns the sum of their curves, so only one curve is sent back."""
+    curve = [0] * steps
+    for seed in seeds:
+        for i, count in enumerate(play(agents_model, steps, seed, **model_params)):
+            curve[i] += count
+    return curve
+
+
+def init_worker() -> None:
+    # Every worker plays its own games, letting torch spawn threads in each of them only oversubscribes the cores
+    torch.set_num_threads(1)
+
+
+def benchmark_all(
+    agents_models: list[str],
+    n_run: int = 1000,
+    steps: int = 400,
+    seed: int = 0,
+    n_workers: int | None = None,
+    runs_per_task: int = 25,
+    **model_params: Any,
+) -> dict[str, list[float]]:
+    """
+    Plays `n_run` games for each agent model on a pool of processes and returns the mean waste count after each step.
+    Game i is played with seed `seed + i`, so results do not depend on the number of workers.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    curves = {agents_model: [0] * steps for agents_model in agents_models}
+
+    with ProcessPoolExecutor(n_workers, initializer=init_worker) as pool:
+        tasks = {
+            pool.submit(
+                play_runs, agents_model, list(range(start, min(start + runs_per_task, seed + n_run))), steps, model_params
+            ): (agents_model, min(runs_per_task, seed + n_run - start))
+            for agents_model in agents_models
+            for start in range(seed, seed + n_run, runs_per_task)
+        }
+
+        with tqdm(total=n_run * len(agents_models)) as pbar:
+            for task in as_completed(tasks):
+                agents_model, n_task_runs = tasks[task]
+                for i, count in enumerate(task.result()):
+                    curves[agents_model][i] += count
+                pbar.update(n_task_runs)
+
+    return {agents_model: [c / n_run for c in curve] for agents_model, curve in curves.items()}
+
+
+def benchmark(agents_model: str, n_run: int = 1000, steps: int = 400, **kwargs: Any) -> list[float]:
+    return benchmark_all([agents_model], n_run, steps, **kwargs)[agents_model]
 
 
 if __name__ == "__main__":
-    for agent_model in ["Random", "Naive", "RuleBased", "CommunicationRuleBased", "DQN"]:
-        curve = benchmark(agent_model, steps=100)
+    import matplotlib.pyplot as plt  # only needed for the plot, kept out of the workers
+
+    curves = benchmark_all(["Random", "Naive", "RuleBased", "CommunicationRuleBased", "DQN"], steps=100)
+    for agent_model, curve in curves.items():
         plt.plot(curve, label=f"{agent_model}")
 
     plt.xlabel("Steps")
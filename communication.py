@@ -1,7 +1,13 @@
 from __future__ import annotations
 
+from collections import deque
 from enum import Enum
-import pickle
+from types import MappingProxyType
+from typing import Any, Callable, Iterator, Mapping, Sequence
+import struct
+import numpy as np
+
+from utils import Color
 
 content_type_to_class: dict[ContentType, type] = {}
 
@@ -32,37 +38,207 @@ class Message:
         return self.content
 
 
+class MessageCodec:
+    """
+    Fixed binary layout of the content of a message type: `struct` packs one message,
+    and the equivalent NumPy record dtype decodes a whole batch of them at once.
+    """
+
+    def __init__(
+        self,
+        fields: list[tuple[str, str]],
+        to_fields: Callable[[Any], tuple],
+        from_fields: Callable[[tuple], Any],
+    ) -> None:
+        """
+        Args:
+            fields: (name, little-endian struct format) of each field, e.g. [("x", "h"), ("y", "h")].
+            to_fields: Readable data -> tuple of field values.
+            from_fields: Tuple of field values -> readable data.
+        """
+        self.struct = struct.Struct("<" + "".join(fmt for _, fmt in fields))
+        self.dtype = np.dtype([(name, "<" + fmt) for name, fmt in fields])
+        self.to_fields = to_fields
+        self.from_fields = from_fields
+
+    def encode(self, readable_data) -> bytes:
+        return self.struct.pack(*self.to_fields(readable_data))
+
+    def decode(self, content: bytes):
+        return self.from_fields(self.struct.unpack(content))
+
+    def decode_batch(self, contents: Sequence[bytes]) -> np.ndarray:
+        """Record array with one row per message, in the order of `contents`."""
+        return np.frombuffer(b"".join(contents), dtype=self.dtype)
+
+
+content_type_to_codec: dict[ContentType, MessageCodec] = {
+    ContentType.ID_POSITION: MessageCodec(
+        [("id", "i"), ("x", "h"), ("y", "h")],
+        lambda data: (data[0], *data[1]),
+        lambda fields: [fields[0], (fields[1], fields[2])],
+    ),
+    ContentType.ID_POSITION_COLOR: MessageCodec(
+        [("id", "i"), ("x", "h"), ("y", "h"), ("color", "B")],
+        lambda data: (data[0], *data[1], data[2]),
+        lambda fields: [fields[0], (fields[1], fields[2]), Color(fields[3])],
+    ),
+    ContentType.TARGET: MessageCodec(
+        [("x", "h"), ("y", "h")],
+        tuple,
+        tuple,
+    ),
+}
+
+
 def readable_data_to_message(raw_data, content_type: ContentType) -> Message:
-    return Message(pickle.dumps(raw_data), content_type)
+    return Message(content_type_to_codec[content_type].encode(raw_data), content_type)
 
 
 def message_to_readable_data(message: Message):
-    return pickle.loads(message.get_content())
+    return content_type_to_codec[message.type].decode(message.content)
+
+
+def messages_to_readable_data(messages: list[Message], content_type: ContentType) -> np.ndarray:
+    """Decodes messages of the same type at once, as a record array (see `MessageCodec.decode_batch`)."""
+    assert all(message.get_type() == content_type for message in messages), "Messages of different types"
+    return content_type_to_codec[content_type].decode_batch([message.get_content() for message in messages])
+
+
+class BroadcastChannel:
+    """
+    Blackboard on which every agent of the team publishes the same kind of data once per step.
+    It is a single table (sender id -> latest data) that every reader shares through a read-only view,
+    so broadcasting costs O(1) per sender instead of one message per receiver and one copy of the table per reader.
+
+    Communication delay is simulated with `delayed_view`: the readers then see the table as it was a few steps ago.
+    `RobotMission` gives the same `communication_delay` to every agent, so in practice there is one delayed view per channel.
+    """
+
+    def __init__(self, clock: Callable[[], int]) -> None:
+        """
+        Args:
+            clock: Returns the current step, used to date the publications.
+        """
+        self.clock = clock
+        self._latest: dict[int, Any] = {}
+        self.view: Mapping[int, Any] = MappingProxyType(self._latest)  # sender id -> latest data
+
+        # Dated publications, only kept when a delayed view exists
+        self.max_delay = 0
+        self._history: dict[int, deque[tuple[int, Any]]] = {}  # sender id -> (step, data), oldest first
+        self._delayed_views: dict[int, DelayedView] = {}
+
+    def publish(self, sender_id: int, data: Any) -> None:
+        self._latest[sender_id] = data
+        if self.max_delay == 0:
+            return
+
+        step = self.clock()
+        history = self._history.get(sender_id)
+        if history is None:
+            history = self._history[sender_id] = deque()
+        history.append((step, data))
+        # Keep the most recent publication that is old enough for the largest delay, drop the older ones
+        while len(history) >= 2 and history[1][0] <= step - self.max_delay:
+            history.popleft()
+
+    def remove_sender(self, sender_id: int) -> None:
+        self._latest.pop(sender_id, None)
+        self._history.pop(sender_id, None)
+        for view in self._delayed_views.values():
+            view.invalidate()
+
+    def delayed_view(self, delay: int) -> Mapping[int, Any]:
+        """Read-only view of the latest data published at least `delay` steps ago, shared by the readers of this delay."""
+        assert delay >= 0, "The delay must be positive"
+        if delay == 0:
+            return self.view
+
+        assert len(self._latest) == 0 or delay <= self.max_delay, "Create delayed views before the first publication"
+        self.max_delay = max(self.max_delay, delay)
+        if delay not in self._delayed_views:
+            self._delayed_views[delay] = DelayedView(self, delay)
+        return self._delayed_views[delay]
+
+
+class DelayedView(Mapping[int, Any]):
+    """
+    Table of a `BroadcastChannel` as it was `delay` steps ago.
+    Publications of the current step are never visible with a delay, so the table is rebuilt at most once per step.
+    """
+
+    def __init__(self, channel: BroadcastChannel, delay: int) -> None:
+        self.channel = channel
+        self.delay = delay
+        self._step: int | None = None
+        self._table: dict[int, Any] = {}
+
+    def invalidate(self) -> None:
+        self._step = None
+
+    def table(self) -> dict[int, Any]:
+        step = self.channel.clock()
+        if step != self._step:
+            self._step = step
+            self._table = {}
+            for sender_id, history in self.channel._history.items():
+                for published_at, data in reversed(history):
+                    if published_at <= step - self.delay:
+                        self._table[sender_id] = data
+                        break
+        return self._table
+
+    def __getitem__(self, sender_id: int) -> Any:
+        return self.table()[sender_id]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.table())
+
+    def __len__(self) -> int:
+        return len(self.table())
 
 
 class Mailbox:
     """
     The mailbox of the agent : the agent receives messages through it.
+    Unread messages are queued by content type, and only the last `history_size` read messages are kept.
     """
 
-    def __init__(self):
-        self.read_messages: list[Message] = []  # most recent is at the end
-        self.unread_messages: list[Message] = []  # most recent is at the end
+    def __init__(self, history_size: int = 64):
+        self.read_messages: deque[Message] = deque(maxlen=history_size)  # most recent is at the end
+        self.unread_messages: dict[ContentType, deque[Message]] = {}  # most recent is at the end of each queue
+
+    def receive(self, message: Message) -> None:
+        queue = self.unread_messages.get(message.type)
+        if queue is None:
+            queue = self.unread_messages[message.type] = deque()
+        queue.append(message)
+
+    def unread_types(self) -> list[ContentType]:
+        return [content_type for content_type, queue in self.unread_messages.items() if len(queue) > 0]
 
-    def receive(self, message) -> None:
-        self.unread_messages.append(message)
+    def n_unread(self, content_type: ContentType | None = None) -> int:
+        if content_type is None:
+            return sum(len(queue) for queue in self.unread_messages.values())
+        return len(self.unread_messages.get(content_type, ()))
 
-    def read_latest_unread(self, keep_unread=False) -> Message:
-        new_message = self.unread_messages.pop(0)
+    def read_oldest_unread(self, content_type: ContentType) -> Message:
+        """Oldest unread message of this type."""
+        new_message = self.unread_messages[content_type].popleft()
         self.read_messages.append(new_message)
         return new_message
 
-    def read_all_unread(self, keep_unread=False) -> list[Message]:
+    def read_all_unread(self, content_type: ContentType | None = None, keep_unread=False) -> list[Message]:
+        """Unread messages of this type (of every type if None), most recent at the end of each type."""
+        content_types = self.unread_types() if content_type is None else [content_type]
         res = []
-        while len(self.unread_messages) > 0:
-            new_message = self.read_latest_unread()
-            res.append(new_message)
-        res.reverse()
-        if keep_unread:
-            self.unread_messages = self.unread_messages + res
-        return res  # most recent is at the end
+        for unread_type in content_types:
+            queue = self.unread_messages.get(unread_type)
+            if not queue:
+                continue
+            res.extend(queue)
+            if not keep_unread:
+                self.read_messages.extend(queue)
+                queue.clear()
+        return res
@@ -0,0 +1,221 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+from __future__ import annotations
+
+import mesa
+import random
+import numpy as np
+
+from typing import TYPE_CHECKING, Iterable, Iterator, Sequence
+
+from agent import Agent
+from objects import Dump, Radioactivity, Waste, random_level
+from utils import Color, Position
+
+if TYPE_CHECKING:
+    from model import RobotMission
+
+
+class MesaGrid(mesa.space.MultiGrid):
+    """
+    Default backend: every cell holds a `Radioactivity` agent, wastes and robots live in the mesa cell lists.
+    """
+
+    def __init__(self, model: RobotMission, width: int, height: int) -> None:
+        super().__init__(width, height, torus=False)
+        self.model = model
+
+    def place_radioactivity(self, pos: Position, color: Color, is_dump: bool = False) -> None:
+        self.place_agent((Dump if is_dump else Radioactivity)(self.model, color), pos)
+
+    def get_color_at(self, pos: Position) -> Color:
+        for cell in self.iter_cell_list_contents([pos]):
+            if isinstance(cell, Radioactivity):
+                return cell.color
+        raise ValueError("No radioactivity found at this position")
+
+    def get_waste_at(self, pos: Position) -> Waste | None:
+        cells = [cell for cell in self.iter_cell_list_contents([pos]) if isinstance(cell, Waste)]
+        assert len(cells) <= 1, "Multiple wastes at the same position"
+        return cells[0] if cells else None
+
+    def get_agent_at(self, pos: Position) -> Agent | None:
+        cells = [cell for cell in self.iter_cell_list_contents([pos]) if isinstance(cell, Agent)]
+        assert len(cells) <= 1, "Multiple agents at the same position"
+        return cells[0] if cells else None
+
+    def iter_pos_with_color(self, color: Color, no_agent=False, no_waste=False) -> Iterator[Position]:
+        for _, pos in self.coord_iter():
+            if no_agent and self.get_agent_at(pos) is not None:
+                continue
+
+            if no_waste and self.get_waste_at(pos) is not None:
+                continue
+
+            if self.get_color_at(pos) == color:
+                yield pos
+
+
+class ArrayGrid:
+    """
+    NumPy backend: the grid is stored as layers of shape (width, height) instead of mesa agents.
+    - `colors`: radioactivity color of each cell (uint8)
+    - `levels`: radioactivity level of each cell (float32)
+    - `wastes`: color of the waste lying on each cell, 0 if there is none (uint8)
+    - `agent_ids`: unique id of the robot standing on each cell, 0 if there is none (int32)
+
+    It exposes the subset of the `mesa.space.MultiGrid` API used by the model and the actions,
+    so it can be swapped in with `RobotMission(grid_backend="array")`.
+    """
+
+    def __init__(self, model: RobotMission, width: int, height: int) -> None:
+        self.model = model
+        self.width = width
+        self.height = height
+        self.torus = False
+
+        self.colors = np.zeros((width, height), dtype=np.uint8)
+        self.levels = np.zeros((width, height), dtype=np.float32)
+        self.wastes = np.zeros((width, height), dtype=np.uint8)
+        self.agent_ids = np.zeros((width, height), dtype=np.int32)
+
+        self._waste_at: dict[Position, Waste] = {}
+        self._agent_by_id: dict[int, Agent] = {}
+        self._neighborhood_cache: dict[tuple[Position, bool, bool, int], Sequence[Position]] = {}
+
+    def place_radioactivity(self, pos: Position, color: Color, is_dump: bool = False) -> None:
+        self.colors[pos] = color
+        self.levels[pos] = random_level(color)
+
+    def place_agent(self, agent: mesa.Agent, pos: Position) -> None:
+        if isinstance(agent, Waste):
+            assert pos not in self._waste_at, "Multiple wastes at the same position"
+            self.wastes[pos] = agent.color
+            self._waste_at[pos] = agent
+        elif isinstance(agent, Agent):
+            assert self.agent_ids[pos] == 0, "Multiple agents at the same position"
+            self.agent_ids[pos] = agent.unique_id
+            self._agent_by_id[agent.unique_id] = agent
+        else:
+            raise TypeError(f"{type(agent).__name__} cannot be placed on an ArrayGrid")
+        agent.pos = pos
+
+    def remove_agent(self, agent: mesa.Agent) -> None:
+        pos = agent.pos
+        assert pos is not None, "Trying to remove an agent that is not placed"
+
+        if isinstance(agent, Waste):
+            del self._waste_at[pos]
+            self.wastes[pos] = 0
+        else:
+            del self._agent_by_id[agent.unique_id]
+            self.agent_ids[pos] = 0
+        agent.pos = None
+
+    def move_agent(self, agent: mesa.Agent, pos: Position) -> None:
+        self.remove_agent(agent)
+        self.place_agent(agent, pos)
+
+    def out_of_bounds(self, pos: Position) -> bool:
+        x, y = pos
+        return x < 0 or x >= self.width or y < 0 or y >= self.height
+
+    def get_neighborhood(
+        self, pos: Position, moore: bool, include_center: bool = False, radius: int = 1
+    ) -> Sequence[Position]:
+        """Same cells, in the same order, as `mesa.space.MultiGrid.get_neighborhood`."""
+        cache_key = (pos, moore, include_center, radius)
+        neighborhood = self._neighborhood_cache.get(cache_key)
+        if neighborhood is not None:
+            return neighborhood
+
+        x, y = pos
+        cells = []
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if not moore and abs(dx) + abs(dy) > radius:
+                    continue
+                if not include_center and dx == dy == 0:
+                    continue
+                if not self.out_of_bounds((x + dx, y + dy)):
+                    cells.append((x + dx, y + dy))
+
+        neighborhood = self._neighborhood_cache[cache_key] = tuple(cells)
+        return neighborhood
+
+    def get_color_at(self, pos: Position) -> Color:
+        return Color(int(self.colors[pos]))
+
+    def get_waste_at(self, pos: Position) -> Waste | None:
+        return self._waste_at.get(pos)
+
+    def get_agent_at(self, pos: Position) -> Agent | None:
+        agent_id = int(self.agent_ids[pos])
+        return self._agent_by_id[agent_id] if agent_id != 0 else None
+
+    def iter_pos_with_color(self, color: Color, no_agent=False, no_waste=False) -> Iterator[Position]:
+        mask = self.colors == color
+        if no_agent:
+            mask &= self.agent_ids == 0
+        if no_waste:
+            mask &= self.wastes == 0
+
+        for x, y in np.argwhere(mask):
+            yield int(x), int(y)
+
+    def iter_cell_list_contents(self, cell_list: list[Position]) -> Iterator[mesa.Agent]:
+        for pos in cell_list:
+            waste = self.get_waste_at(pos)
+            if waste is not None:
+                yield waste
+            agent = self.get_agent_at(pos)
+            if agent is not None:
+                yield agent
+
+    def get_cell_list_contents(self, cell_list: list[Position]) -> list[mesa.Agent]:
+        return list(self.iter_cell_list_contents(cell_list))
+
+    @property
+    def agents(self) -> list[mesa.Agent]:
+        """Wastes and robots on the grid, in the same cell order as `mesa.space.MultiGrid.agents`."""
+        occupied = np.argwhere((self.wastes != 0) | (self.agent_ids != 0))
+        return self.get_cell_list_contents([(int(x), int(y)) for x, y in occupied])
+
+
+class FreeCells:
+    """Cells that can still receive an entity, with O(1) random sampling and removal."""
+
+    def __init__(self, cells: Iterable[Position]) -> None:
+        self.cells = list(cells)
+        self.index = {cell: i for i, cell in enumerate(self.cells)}
+
+    def remove(self, cell: Position) -> None:
+        # Move the last cell into the hole instead of shifting the whole list
+        i = self.index.pop(cell)
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.index[last] = i
+
+    def pop_random(self) -> Position:
+        if len(self.cells) == 0:
+            raise ValueError("No free cell left")
+        cell = self.cells[random.randrange(len(self.cells))]
+        self.remove(cell)
+        return cell
+
+    def __contains__(self, cell: Position) -> bool:
+        return cell in self.index
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+
+str_to_grid: dict[str, type[MesaGrid] | type[ArrayGrid]] = {
+    "mesa": MesaGrid,
+    "array": ArrayGrid,
+}
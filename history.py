@@ -0,0 +1,126 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterator, Sequence
+
+
+# A step as returned by `RobotMission.serialize`:
+# {"step", "agents": [{"id", "x", "y", "inventory"}], "wastes": [{"x", "y", "color"}]}
+State = dict[str, Any]
+
+
+class _Frame:
+    """Mutable view of a step, indexed by agent id and waste position so deltas can be applied in O(changes)."""
+
+    def __init__(self, state: State) -> None:
+        self.agents = {agent["id"]: agent for agent in state["agents"]}
+        self.wastes = {(waste["x"], waste["y"]): waste for waste in state["wastes"]}
+
+    def apply(self, delta: dict[str, list]) -> None:
+        for agent in delta["agents"]:
+            self.agents[agent["id"]] = agent
+        for x, y in delta["removed_wastes"]:
+            del self.wastes[(x, y)]
+        for waste in delta["added_wastes"]:
+            self.wastes[(waste["x"], waste["y"])] = waste
+
+    def to_state(self, step: int) -> State:
+        return {
+            "step": step,
+            "agents": [{**agent, "inventory": list(agent["inventory"])} for agent in self.agents.values()],
+            "wastes": [dict(waste) for waste in self.wastes.values()],
+        }
+
+
+def compute_delta(previous: State, current: State) -> dict[str, list]:
+    """
+    Difference between two steps (usually consecutive ones):
+    - agents: the agents that moved or whose inventory changed (pick, drop, merge)
+    - removed_wastes: positions of the wastes that left the grid (picked)
+    - added_wastes: the wastes that appeared on the grid (dropped)
+    """
+    previous_agents = {agent["id"]: agent for agent in previous["agents"]}
+    previous_wastes = {(waste["x"], waste["y"]): waste["color"] for waste in previous["wastes"]}
+    current_wastes = {(waste["x"], waste["y"]): waste for waste in current["wastes"]}
+
+    return {
+        "agents": [agent for agent in current["agents"] if agent != previous_agents.get(agent["id"])],
+        "removed_wastes": [
+            [x, y]
+            for (x, y), color in previous_wastes.items()
+            if (x, y) not in current_wastes or current_wastes[(x, y)]["color"] != color
+        ],
+        "added_wastes": [
+            waste for pos, waste in current_wastes.items() if previous_wastes.get(pos) != waste["color"]
+        ],
+    }
+
+
+class DeltaHistory(Sequence[State]):
+    """
+    History of a simulation stored as a full keyframe every `keyframe_interval` steps and a delta for every other step.
+    It behaves like the list of `RobotMission.serialize` snapshots it replaces: `history[i]` rebuilds step i
+    from the closest keyframe, and iterating replays the deltas in order.
+    """
+
+    def __init__(self, keyframe_interval: int = 100) -> None:
+        assert keyframe_interval >= 1, "The keyframe interval must be at least 1"
+        self.keyframe_interval = keyframe_interval
+        self.keyframes: list[State] = []
+        self.deltas: list[dict[str, list] | None] = []  # deltas[i] goes from step i - 1 to step i
+        self._last: State | None = None
+
+    def append(self, state: State) -> None:
+        if self._last is None or len(self) % self.keyframe_interval == 0:
+            self.keyframes.append(state)
+            self.deltas.append(None)
+        else:
+            self.deltas.append(compute_delta(self._last, state))
+        self._last = state
+
+    def __len__(self) -> int:
+        return len(self.deltas)
+
+    def __getitem__(self, index: int) -> State:  # type: ignore[override]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+
+        keyframe_idx = index // self.keyframe_interval
+        frame = _Frame(self.keyframes[keyframe_idx])
+        for step in range(keyframe_idx * self.keyframe_interval + 1, index + 1):
+            frame.apply(self.deltas[step])  # type: ignore[arg-type]
+        return frame.to_state(index)
+
+    def __iter__(self) -> Iterator[State]:
+        frame: _Frame | None = None
+        for step, delta in enumerate(self.deltas):
+            if delta is None:
+                frame = _Frame(self.keyframes[step // self.keyframe_interval])
+            else:
+                assert frame is not None
+                frame.apply(delta)
+            yield frame.to_state(step)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"keyframe_interval": self.keyframe_interval, "keyframes": self.keyframes, "deltas": self.deltas}
+
+    @staticmethod
+    def from_dict(data: dict[str, Any]) -> DeltaHistory:
+        history = DeltaHistory(data["keyframe_interval"])
+        history.keyframes = data["keyframes"]
+        history.deltas = data["deltas"]
+        return history
+
+
+def steps_from_dict(data: dict[str, Any]) -> Sequence[State]:
+    """The steps of a recording saved by `RobotMission.to_dict`, whichever history mode produced it."""
+    if "delta_steps" in data:
+        return DeltaHistory.from_dict(data["delta_steps"])
+    return data["steps"]
@@ -1,40 +1,56 @@
 from abc import ABC
-from communication import Message, Mailbox, ContentType, message_to_readable_data
+from typing import Mapping
+
+from communication import Mailbox, ContentType, Message, messages_to_readable_data
+from utils import Color, Position
 
 
 class Information(ABC):
+    # Types of the messages this information is built from
+    content_types: tuple[ContentType, ...] = ()
+
     def __init__(self) -> None:
         pass
 
-    def update(self, mailbox: Mailbox, keep_unread) -> None:
-        pass
+    def update(self, mailbox: Mailbox, keep_unread=False) -> None:
+        for content_type in self.content_types:
+            messages = mailbox.read_all_unread(content_type, keep_unread=keep_unread)
+            if len(messages) > 0:
+                self.update_from_messages(content_type, messages)
+
+    def update_from_messages(self, content_type: ContentType, messages: list[Message]) -> None:
+        """Called with the new messages of each type of `content_types`, oldest first."""
 
 
 class CombinedInformation(Information):
+    """
+    Reads the mailbox once and routes the messages of each type to the informations subscribed to it.
+    Messages no information subscribes to are marked as read.
+    """
+
     def __init__(self, informations: dict[str, Information]) -> None:
         self.informations = informations
+        self.subscribers: dict[ContentType, list[Information]] = {}
+        for information in informations.values():
+            for content_type in information.content_types:
+                self.subscribers.setdefault(content_type, []).append(information)
 
     def update(self, mailbox: Mailbox, keep_unread=False) -> None:
-        for information in self.informations.values():
-            information.update(mailbox, keep_unread=True)
-        mailbox.read_all_unread(keep_unread=keep_unread)
+        for content_type in mailbox.unread_types():
+            messages = mailbox.read_all_unread(content_type, keep_unread=keep_unread)
+            for information in self.subscribers.get(content_type, ()):
+                information.update_from_messages(content_type, messages)
 
 
 class AllPositionsAndColorsInformation(Information):
-    def __init__(self) -> None:
-        self.positions = {}
-        self.colors = {}
+    """
+    The latest position and color published by each agent on the `ContentType.ID_POSITION_COLOR` channel
+    (at least `RobotMission.communication_delay` steps ago).
+    `positions_and_colors` is the read-only view shared by every agent, so there is nothing to read from the mailbox.
+    """
 
-    def update_from_message(self, message: Message) -> None:
-        unique_id, position, color = message_to_readable_data(message)
-        self.positions[unique_id] = position
-        self.colors[unique_id] = color
-
-    def update(self, mailbox: Mailbox, keep_unread=False) -> None:
-        new_messages = mailbox.read_all_unread(keep_unread=keep_unread)
-        for message in new_messages:
-            if message.get_type() == ContentType.ID_POSITION_COLOR:
-                self.update_from_message(message)
+    def __init__(self, positions_and_colors: Mapping[int, tuple[Position, Color]]) -> None:
+        self.positions_and_colors = positions_and_colors
 
 
 class TargetInformation(Information):
@@ -42,12 +58,12 @@ class TargetInformation(Information):
     self.targets is a list of tuples (x, y) where x and y are the coordinates of the target. Top priority is self.targets[0].
     """
 
+    content_types = (ContentType.TARGET,)
+
     def __init__(self) -> None:
         super().__init__()
         self.targets = []
 
-    def update(self, mailbox: Mailbox, keep_unread=False) -> None:
-        new_messages = mailbox.read_all_unread(keep_unread=keep_unread)
-        for message in new_messages:
-            if message.get_type() == ContentType.TARGET:
-                self.targets.append(message_to_readable_data(message))
+    def update_from_messages(self, content_type: ContentType, messages: list[Message]) -> None:
+        targets = messages_to_readable_data(messages, ContentType.TARGET)
+        self.targets.extend(zip(targets["x"].tolist(), targets["y"].tolist()))
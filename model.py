@@ -7,7 +7,7 @@ Date: 11/03/2025
 from __future__ import annotations
 
 import json
-from typing import Any, Iterator, cast
+from typing import TYPE_CHECKING, Any, Iterator, Mapping, cast
 import mesa
 import random
 
@@ -18,40 +18,60 @@ from agent import Agent
 
 from agents.RL import RLAgent
 
-from objects import Dump, Radioactivity, Waste
+from grid import ArrayGrid, FreeCells, MesaGrid, str_to_grid
+from history import DeltaHistory
+from profiler import NoProfiler, StepProfiler
+from spatial import SpatialIndex
+from state import StateTensor
+from objects import Waste
 from perception import Perception
 from utils import Color, Position
 from agents.all_agents import default_agent, get_agent_class
 
-from communication import Message
+from communication import BroadcastChannel, ContentType, Message
+
+if TYPE_CHECKING:
+    from record import Recorder
 
 
 default_agents_params: dict[Color, dict[str, Any]] = {Color.GREEN: {}, Color.YELLOW: {}, Color.RED: {}}
 
 
 def model_to_n_waste(model: RobotMission) -> dict[Color, int]:
-    n_waste = {Color.GREEN: 0, Color.YELLOW: 0, Color.RED: 0}
-
-    for cells, coords in model.grid.coord_iter():
-        cells = cast(mesa.space.MultiGridContent, cells)
-
-        for cell in cells:
-            if isinstance(cell, Waste):
-                n_waste[cell.color] += 1
-            elif isinstance(cell, Agent):
-                for waste in cell.inventory:
-                    n_waste[waste.color] += 1
-
-    return n_waste
+    return {color: model.get_n_wastes(color) for color in Color}
 
 
 class MessageService:
     """
     Object possessed by the model that can transfer messages between agents.
+    Point to point messages go to the mailbox of the receiver, broadcast data goes to a channel per content type.
+    The positions broadcast on the `ContentType.ID_POSITION_COLOR` channel are also kept in a spatial index,
+    they are the positions the agents last announced (see `RobotMission.agent_index` for their current positions).
     """
 
     def __init__(self, model):
         self.model = model
+        self.channels: dict[ContentType, BroadcastChannel] = {}
+        self.position_index = SpatialIndex()
+
+    def get_channel(self, content_type: ContentType) -> BroadcastChannel:
+        if content_type not in self.channels:
+            self.channels[content_type] = BroadcastChannel(lambda: self.model.step_idx)
+        return self.channels[content_type]
+
+    def channel(self, content_type: ContentType, delay: int = 0) -> Mapping[int, Any]:
+        """Read-only view of the latest data published by each agent on this channel, at least `delay` steps ago."""
+        return self.get_channel(content_type).delayed_view(delay)
+
+    def publish(self, content_type: ContentType, sender_id: int, data: Any):
+        self.get_channel(content_type).publish(sender_id, data)
+        if content_type == ContentType.ID_POSITION_COLOR:
+            self.position_index.update(sender_id, *data)
+
+    def remove_sender(self, sender_id: int):
+        for channel in self.channels.values():
+            channel.remove_sender(sender_id)
+        self.position_index.remove(sender_id)
 
     def send(self, receiver_id: int, message: Message):
         receiver = self.model.get_agent_by_id(receiver_id)
@@ -79,6 +99,9 @@ class RobotMission(mesa.Model):
         radioactivity_proportions: list[float] = [1 / 3, 1 / 3, 1 / 3],
         seed: int | None = None,
         agent_params: dict[Color, dict[str, Any]] = default_agents_params,
+        grid_backend: str = "mesa",
+        history_mode: str = "full",
+        communication_delay: int = 0,
     ):
         """Initialize a RobotMission instance.
 
@@ -88,9 +111,14 @@ class RobotMission(mesa.Model):
             n_<color>_agents : The number of <color> agents.
             radioactivity_proportions (list[float]): The proportions of the grid for each type of radioactivity. We assume that a column has a single radioactivity.
             seed (int): The seed for the random number generator.
+            grid_backend (str): "mesa" to store the grid as mesa agents, "array" to store it as NumPy layers (see `grid.py`).
+            history_mode (str): "full" to keep every step, "delta" to keep keyframes and deltas (see `history.py`).
+            communication_delay (int): Steps before a broadcast position reaches the other agents (the same for every agent).
         """
         super().__init__(seed=seed)
         random.seed(seed)
+        self.profiler: NoProfiler | StepProfiler = NoProfiler()
+        self.state_tensor: StateTensor | None = None
         self.width = width
         self.height = height
         self.n_agents_by_color = {
@@ -100,7 +128,7 @@ class RobotMission(mesa.Model):
         }
         self.radioactivity_proportions = radioactivity_proportions
 
-        self.grid = mesa.space.MultiGrid(self.width, self.height, torus=False)
+        self.grid: MesaGrid | ArrayGrid = str_to_grid[grid_backend](self, self.width, self.height)
         self.step_idx = 0
 
         green_yellow_border = int(self.width * self.radioactivity_proportions[0])
@@ -114,6 +142,10 @@ class RobotMission(mesa.Model):
 
         self.dumped_wastes: list[Waste] = []
 
+        # Live counters kept up to date by the actions, so we never have to scan the grid to count wastes
+        self.n_wastes_on_grid = {color: 0 for color in Color}
+        self.n_wastes_in_inventory = {color: 0 for color in Color}
+
         wastes = {
             Color.GREEN: n_green_wastes,
             Color.YELLOW: n_yellow_wastes,
@@ -121,6 +153,10 @@ class RobotMission(mesa.Model):
         }
         self.place_waste(wastes)
 
+        self.message_service = MessageService(self)
+        self.communication_delay = communication_delay
+        self.agents_by_id: dict[int, Agent] = {}
+        self.agent_index = SpatialIndex()  # current position of every agent, kept up to date by `add_agent`/`do`
         agents_class = [green_agent_model, yellow_agent_model, red_agent_model]
         self.place_agents({color: get_agent_class(agent, color) for agent, color in zip(agents_class, Color)}, agent_params)
 
@@ -132,27 +168,21 @@ class RobotMission(mesa.Model):
         )
         self.datacollector.collect(self)
 
-        self.history: list[dict[str, Any]] = []
-
-        self.message_service = MessageService(self)
+        assert history_mode in ("full", "delta"), f"Unknown history mode {history_mode}"
+        self.history: list[dict[str, Any]] | DeltaHistory | Recorder = [] if history_mode == "full" else DeltaHistory()
 
     @property
     def n_agents(self) -> int:
         return sum(self.n_agents_by_color.values())
 
     def dump_waste(self, waste: Waste) -> None:
-        """Remove a waste from the grid and add it to the list of dumped wastes."""
+        """Remove a waste dropped by an agent from the simulation and add it to the list of dumped wastes."""
         self.dumped_wastes.append(waste)
+        self.n_wastes_in_inventory[waste.color] -= 1
         waste.remove()
 
     def get_n_wastes(self, color: Color) -> int:
-        s = 0
-        for waste in [cell for cell in self.agents if isinstance(cell, Waste)]:
-            s += 1 if waste.color == color else 0
-        for agent in self.get_agents():
-            for waste in agent.inventory:
-                s += 1 if waste.color == color else 0
-        return s
+        return self.n_wastes_on_grid[color] + self.n_wastes_in_inventory[color]
 
     def serialize(self):
         """Serialize the model state. (Used for replay)"""
@@ -181,7 +211,7 @@ class RobotMission(mesa.Model):
         for x in range(0, self.width):
             for y in range(0, self.height):
                 if x == self.width - 1 and y == (self.height - 1) // 2:
-                    self.grid.place_agent(Dump(self, Color.RED), (x, y))
+                    self.grid.place_radioactivity((x, y), Color.RED, is_dump=True)
                     self.dump_pos = (x, y)
                     continue
 
@@ -191,7 +221,7 @@ class RobotMission(mesa.Model):
                     color = Color.YELLOW
                 else:
                     color = Color.RED
-                self.grid.place_agent(Radioactivity(self, color), (x, y))
+                self.grid.place_radioactivity((x, y), color)
 
     def run(self, steps: int) -> None:
         for _ in range(steps):
@@ -201,85 +231,126 @@ class RobotMission(mesa.Model):
 
     def place_waste(self, wastes: dict[Color, int]) -> None:
         for color, n_waste in wastes.items():
+            free_cells = FreeCells(self.iter_pos_with_color(color, no_waste=True, no_dump=True))
             for _ in range(n_waste):
-                pos = self.get_random_pos_with_color(color, no_waste=True, no_dump=True)
+                pos = free_cells.pop_random()
                 self.grid.place_agent(Waste(self, color), pos)
+                self.n_wastes_on_grid[color] += 1
 
     def get_color_at(self, pos: Position) -> Color:
-        for cell in self.grid.iter_cell_list_contents([pos]):
-            if isinstance(cell, Radioactivity):
-                return cell.color
-        raise ValueError("No radioactivity found at this position")
+        return self.grid.get_color_at(pos)
 
     def iter_pos_with_color(self, color: Color, no_agent=False, no_waste=False, no_dump=False) -> Iterator[Position]:
-        for cells, pos in self.grid.coord_iter():
-            cells = cast(mesa.space.MultiGridContent, cells)
-
-            if no_agent and self.is_any_agent_at(pos):
-                continue
-
-            if no_waste and self.is_any_waste_at(pos):
-                continue
-
+        for pos in self.grid.iter_pos_with_color(color, no_agent, no_waste):
             if no_dump and self.dump_pos == pos:
                 continue
 
-            for cell in cells:
-                if isinstance(cell, Radioactivity) and cell.color == color:
-                    yield pos
+            yield pos
 
     def get_random_pos_with_color(self, color: Color, no_agent=False, no_waste=False, no_dump=False) -> Position:
         return random.choice(list(self.iter_pos_with_color(color, no_agent, no_waste, no_dump)))
 
     def is_any_agent_at(self, pos: Position) -> bool:
-        return any(isinstance(cell, Agent) for cell in self.grid.iter_cell_list_contents([pos]))
+        return self.grid.get_agent_at(pos) is not None
 
     def get_waste_at(self, pos: Position) -> Waste:
-        cells = [cell for cell in self.grid.iter_cell_list_contents([pos]) if isinstance(cell, Waste)]
-        assert len(cells) <= 1, "Multiple wastes at the same position"
-        assert len(cells) >= 1, "No waste at this position"
-        return cells[0]
+        waste = self.grid.get_waste_at(pos)
+        assert waste is not None, "No waste at this position"
+        return waste
 
     def is_any_waste_at(self, pos: Position) -> bool:
-        return any(isinstance(cell, Waste) for cell in self.grid.iter_cell_list_contents([pos]))
+        return self.grid.get_waste_at(pos) is not None
 
     def get_agents(self) -> list[Agent]:
         return [cell for cell in self.grid.agents if isinstance(cell, Agent)]
 
     def place_agents(self, agent_model: dict[Color, type[Agent]], params: dict[Color, dict[str, Any]]) -> None:
         for color in Color:
+            free_cells = FreeCells(self.iter_pos_with_color(color, no_agent=True))
             for agent_idx in range(self.n_agents_by_color[color]):
-                pos = self.get_random_pos_with_color(color, no_agent=True)
+                pos = free_cells.pop_random()
+
+                self.add_agent(agent_model[color](self, color, **params[color]), pos)
 
-                self.grid.place_agent(agent_model[color](self, color, **params[color]), pos)
+    def add_agent(self, agent: Agent, pos: Position) -> None:
+        self.grid.place_agent(agent, pos)
+        self.agents_by_id[agent.unique_id] = agent
+        self.agent_index.update(agent.unique_id, pos, agent.color)
+
+    def remove_agent(self, agent: Agent) -> None:
+        self.grid.remove_agent(agent)
+        del self.agents_by_id[agent.unique_id]
+        self.agent_index.remove(agent.unique_id)
+        self.message_service.remove_sender(agent.unique_id)
+        agent.remove()
+
+    def enable_profiling(self, trace: bool = False) -> StepProfiler:
+        """Measure the phases of the following steps (see `profiler.py`)."""
+        self.profiler = StepProfiler(trace)
+        for agent in self.get_agents():
+            self.profiler.attach(agent)
+        return self.profiler
 
     def step(self) -> None:
-        agents = self.get_agents()
-        random.shuffle(agents)
-        for agent in agents:
-            agent.step()
-        self.datacollector.collect(self)
-        self.history.append(self.serialize())
-        self.step_idx += 1
+        profiler = self.profiler
+        with profiler.measure("step"):
+            agents = self.get_agents()
+            random.shuffle(agents)
+            for agent in agents:
+                agent.step()
+            with profiler.measure("datacollector.collect"):
+                self.datacollector.collect(self)
+            with profiler.measure("serialize"):
+                self.history.append(self.serialize())
+            self.step_idx += 1
 
     def do(self, action: Action, agent: Agent) -> Perception:
+        previous_pos = agent.get_true_pos()
+        perception = self.apply_action(action, agent)
+        self.agent_index.update(agent.unique_id, agent.get_true_pos(), agent.color)
+        if self.state_tensor is not None:
+            self.state_tensor.update(agent, previous_pos)
+        return perception
+
+    def apply_action(self, action: Action, agent: Agent) -> Perception:
+        if self.profiler.enabled:
+            return self.profiler.do(self, action, agent)
+
         if action.can_apply(self, agent):
             action.apply(self, agent)
         return Perception.from_agent(self, agent)
 
     def to_dict(self) -> dict[str, Any]:
-        return {
+        """
+        The header and the steps of the simulation, as read by `replay.py`.
+        Raises a ValueError when a `Recorder` streams the steps to disk: the model does not hold them.
+        """
+        data: dict[str, Any] = {
             "width": self.width,
             "height": self.height,
             "agents_color": [{"id": agent.unique_id, "color": agent.color} for agent in self.get_agents()],
-            "steps": self.history,
         }
+        if isinstance(self.history, DeltaHistory):
+            data["delta_steps"] = self.history.to_dict()
+        elif isinstance(self.history, list):
+            data["steps"] = self.history
+        else:
+            raise ValueError(
+                f"The steps are recorded to {self.history.path} by a Recorder, read them with `record.read_recording`"
+            )
+        return data
 
     def save(self, path: str = "simulation.json") -> None:
+        data = self.to_dict()  # before opening the file, so that a model with a Recorder leaves no empty file
         with open(path, "w") as f:
-            json.dump(self.to_dict(), f, indent=4)
+            json.dump(data, f, indent=4)
 
-    def to_tensor(self) -> torch.Tensor:
+    def enable_state_tensor(self) -> StateTensor:
+        """Keeps the tensor of `to_tensor` up to date after each action, once the RL agents have their training ids."""
+        self.state_tensor = StateTensor(self)
+        return self.state_tensor
+
+    def to_tensor(self, copy: bool = True) -> torch.Tensor:
         """
         - 3 dimensions for the colors of the wastes
         - 1 dimension for the non-RL agents
@@ -287,7 +358,15 @@ class RobotMission(mesa.Model):
         - for each RL agent:
             - 1 dimension for the agent itself
             - 2 dimensions for the inventory
+
+        With `enable_state_tensor`, the maintained tensor is returned instead of being rebuilt from the grid.
+        `copy=False` then returns it without copying it: the next actions modify it in place.
         """
+        if self.state_tensor is not None:
+            return self.state_tensor.tensor.clone() if copy else self.state_tensor.tensor
+        return self.build_tensor()
+
+    def build_tensor(self) -> torch.Tensor:
         rl_agents = [agent for agent in self.get_agents() if isinstance(agent, RLAgent)]
 
         out = torch.zeros((len(Color) + 3 * (len(rl_agents) + 1), self.width, self.height))
@@ -308,10 +387,17 @@ class RobotMission(mesa.Model):
         return out
 
     def get_agent_by_id(self, agent_id: int) -> Agent:
-        for agent in self.get_agents():
-            if agent.unique_id == agent_id:
-                return agent
+        agent = self.agents_by_id.get(agent_id)
+        if agent is not None:
+            return agent
+
+        raise ValueError(f"Agent with id {agent_id} not found, the possible ids are {list(self.agents_by_id)}")
+
+    def get_closest_agent(self, pos: Position, color: Color) -> Agent | None:
+        """Closest agent of this color to `pos` (Manhattan distance), None if there is none."""
+        agent_id = self.agent_index.nearest(pos, color)
+        return None if agent_id is None else self.agents_by_id[agent_id]
 
-        possible_ids = [agent.unique_id for agent in self.get_agents()]
-        raise ValueError(f"Agent with id {agent_id} not found, the possible ids are {possible_ids}")
-        # return self._agents.get(agent_id)
+    def get_agents_within(self, pos: Position, radius: int, color: Color | None = None) -> list[Agent]:
+        """Agents (of this color if given) at a Manhattan distance of at most `radius` of `pos`."""
+        return [self.agents_by_id[agent_id] for agent_id in self.agent_index.within_radius(pos, radius, color)]
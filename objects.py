@@ -13,6 +13,14 @@ if TYPE_CHECKING:
     from model import RobotMission
 
 
+def random_level(color: Color) -> float:
+    if color == Color.GREEN:
+        return random.uniform(0, 1 / 3)
+    elif color == Color.YELLOW:
+        return random.uniform(1 / 3, 2 / 3)
+    return random.uniform(2 / 3, 1)
+
+
 class Radioactivity(mesa.Agent):
     model: "RobotMission"  # type: ignore
 
@@ -30,12 +38,7 @@ class Radioactivity(mesa.Agent):
         self.instanciate_level()
 
     def instanciate_level(self):
-        if self.color == Color.GREEN:
-            self.level = random.uniform(0, 1 / 3)
-        elif self.color == Color.YELLOW:
-            self.level = random.uniform(1 / 3, 2 / 3)
-        elif self.color == Color.RED:
-            self.level = random.uniform(2 / 3, 1)
+        self.level = random_level(self.color)
 
 
 class Waste(mesa.Agent):
@@ -0,0 +1,103 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import torch
+
+from typing import Sequence
+
+from knowledge import AllKnowledge
+from utils import Color, Direction
+
+
+N_FEATURES = 26
+# Features before this index are small counts or 0/1 flags, the last ones are the position relative to the zone
+N_DISCRETE_FEATURES = 24
+
+# (color, grid width, grid height) -> (zone center x, zone center y, x scale, y scale) as in `AllKnowledge.to_tensor`
+_zones: dict[tuple[Color, int, int], tuple[int, int, int, int]] = {}
+
+
+def _zone(knowledge: AllKnowledge) -> tuple[int, int, int, int]:
+    key = (knowledge.color, knowledge.grid_width, knowledge.grid_height)
+    zone = _zones.get(key)
+    if zone is None:
+        zone_x, zone_y = knowledge.zone_center
+        zone = _zones[key] = (zone_x, zone_y, knowledge.zone_width // 2, knowledge.grid_height // 2)
+    return zone
+
+
+def build_observations(knowledges: Sequence[AllKnowledge], out: torch.Tensor | None = None) -> torch.Tensor:
+    """
+    `torch.stack([knowledge.to_tensor() for knowledge in knowledges])`, computed for all the agents at once.
+
+    Like `AllKnowledge.to_tensor`, the cases come from the last perception of each agent,
+    they are gathered as small integer codes and all the features are then computed with array operations.
+
+    Args:
+        out: Contiguous float32 tensor of shape (len(knowledges), 26) to write into (e.g. a slot of a replay buffer),
+            a new one is allocated if None.
+    """
+    n = len(knowledges)
+    if out is None:
+        out = torch.empty((n, N_FEATURES))
+    assert out.shape == (n, N_FEATURES) and out.dtype == torch.float32 and out.is_contiguous(), "Invalid output buffer"
+
+    # cases[i, direction] = (is the case perceived, case color, waste color or 0, agent color or 0)
+    cases = np.zeros((n, len(Direction), 4), dtype=np.int8)
+    colors = np.empty(n, dtype=np.int8)
+    inventory = np.zeros((n, 2), dtype=np.float32)  # wastes of my color, wastes of the next color
+    positions = np.empty((n, 2), dtype=np.int64)
+    zones = np.empty((n, 4), dtype=np.int64)
+
+    for i, knowledge in enumerate(knowledges):
+        color = knowledge.color
+        colors[i] = color
+        for waste in knowledge.inventory:
+            if waste.color == color or waste.color == color + 1:
+                inventory[i, waste.color - color] += 1
+
+        perception = knowledge.perception
+        for direction in perception:
+            case = perception[direction]
+            cases[i, direction] = (
+                1,
+                case.color,
+                case.waste.color if case.waste is not None else 0,
+                case.agent.color if case.agent is not None else 0,
+            )
+        positions[i] = knowledge.pos
+        zones[i] = _zone(knowledge)
+
+    buffer = out.numpy()
+    buffer[:, 0:2] = inventory
+
+    waste_colors = cases[:, Direction.NONE, 2]
+    buffer[:, 2] = waste_colors != 0
+    buffer[:, 3] = waste_colors == colors
+
+    my_colors = colors[:, None]
+    directions = cases[:, Direction.not_none()]  # (n, 4, 4)
+    perceived = directions[..., 0] != 0
+    features = np.stack(
+        [
+            directions[..., 1] <= my_colors,
+            directions[..., 2] != 0,
+            directions[..., 2] == my_colors,
+            directions[..., 3] != 0,
+            directions[..., 3] == my_colors,
+        ],
+        axis=-1,
+    )
+    buffer[:, 4:24] = (features & perceived[..., None]).reshape(n, 20)
+
+    # Divided as Python ints would be, in float64, then rounded to float32 like the tensor assignment
+    buffer[:, 24] = (positions[:, 0] - zones[:, 0]) / zones[:, 2]
+    buffer[:, 25] = (positions[:, 1] - zones[:, 1]) / zones[:, 3]
+
+    return out
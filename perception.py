@@ -8,7 +8,7 @@ from __future__ import annotations
 
 from typing import TYPE_CHECKING
 
-from objects import Radioactivity, Waste
+from objects import Waste
 from utils import Color, Direction, Position
 from agent import Agent, Inventory
 
@@ -48,24 +48,9 @@ class Perception:
         pos = agent.get_true_pos()
 
         for coords in model.grid.get_neighborhood(pos, moore=False, include_center=True):
-            _waste = None
-            _agent = None
-            _color = None
-
-            for cell in model.grid.get_cell_list_contents([coords]):
-                if isinstance(cell, Waste):
-                    assert _waste is None, "Multiple waste in the same cell"
-                    _waste = cell
-                elif isinstance(cell, Agent):
-                    assert _agent is None, "Multiple agents in the same cell"
-                    _agent = cell
-                elif isinstance(cell, Radioactivity):
-                    assert _color is None, "Multiple radioactivity in the same cell"
-                    _color = cell.color
-
-            assert _color is not None, "No radioactivity in the cell"
-
-            cases[Direction.get_direction(pos, coords)] = CasePerception(_color, _waste, _agent)
+            cases[Direction.get_direction(pos, coords)] = CasePerception(
+                model.grid.get_color_at(coords), model.grid.get_waste_at(coords), model.grid.get_agent_at(coords)
+            )
 
         return Perception(cases, agent.inventory, agent.color, model.dump_pos, pos, model.grid.width, model.grid.height)
 
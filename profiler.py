@@ -0,0 +1,161 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+from contextlib import nullcontext
+from functools import wraps
+from typing import TYPE_CHECKING, Any, Callable, ContextManager
+
+from perception import Perception
+
+if TYPE_CHECKING:
+    from action import Action
+    from agent import Agent
+    from model import RobotMission
+
+
+_no_measure = nullcontext()
+
+
+class NoProfiler:
+    """Default profiler of a model: measuring a phase only costs a method call returning a shared no-op context."""
+
+    enabled = False
+
+    def measure(self, phase: str, owner: Any = None, action: Any = None) -> ContextManager:
+        return _no_measure
+
+
+class _Measure:
+    __slots__ = ("profiler", "key", "start")
+
+    def __init__(self, profiler: StepProfiler, key: tuple[str, str, str]) -> None:
+        self.profiler = profiler
+        self.key = key
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args) -> None:
+        end = time.perf_counter()
+        stat = self.profiler.stats.get(self.key)
+        if stat is None:
+            stat = self.profiler.stats[self.key] = [0.0, 0]
+        stat[0] += end - self.start
+        stat[1] += 1
+
+        if self.profiler.trace:
+            phase, owner, action = self.key
+            self.profiler.events.append(
+                {
+                    "name": f"{phase} ({action})" if action else phase,
+                    "cat": owner,
+                    "ph": "X",
+                    "ts": (self.start - self.profiler.origin) * 1e6,
+                    "dur": (end - self.start) * 1e6,
+                    "pid": 0,
+                    "tid": 0,
+                }
+            )
+
+
+class StepProfiler:
+    """
+    Accumulates the wall time and the number of calls of each phase of `RobotMission.step`,
+    per agent class and, for `can_apply` / `apply`, per action class.
+
+    Enable it with `model.enable_profiling()`: the methods of the agents are then wrapped on each instance,
+    so a model that is not profiled runs the exact same code as before.
+    """
+
+    enabled = True
+
+    def __init__(self, trace: bool = False) -> None:
+        """
+        Args:
+            trace: Also keep every measure as an event for `export_chrome_trace` (memory grows with the run length).
+        """
+        self.trace = trace
+        self.stats: dict[tuple[str, str, str], list] = {}  # (phase, owner, action) -> [total time, calls]
+        self.events: list[dict[str, Any]] = []
+        self.origin = time.perf_counter()
+
+    def measure(self, phase: str, owner: Any = None, action: Any = None) -> ContextManager:
+        owner_name = type(owner).__name__ if owner is not None else ""
+        action_name = type(action).__name__ if action is not None else ""
+        return _Measure(self, (phase, owner_name, action_name))
+
+    def wrap(self, phase: str, function: Callable, owner: Any) -> Callable:
+        @wraps(function)
+        def measured(*args, **kwargs):
+            with self.measure(phase, owner):
+                return function(*args, **kwargs)
+
+        return measured
+
+    def attach(self, agent: Agent) -> None:
+        """Measures the phases of `Agent.step` (and `CommunicationAgent.step`) for this agent."""
+        agent.knowledge.update = self.wrap("knowledge.update", agent.knowledge.update, agent)  # type: ignore
+        agent.deliberate = self.wrap("deliberate", agent.deliberate, agent)  # type: ignore
+
+        if hasattr(agent, "information"):
+            agent.information.update = self.wrap("information.update", agent.information.update, agent)  # type: ignore
+        if hasattr(agent, "send_messages"):
+            agent.send_messages = self.wrap("send_messages", agent.send_messages, agent)  # type: ignore
+
+    def do(self, model: RobotMission, action: Action, agent: Agent) -> Perception:
+        """Measured version of `RobotMission.do`."""
+        with self.measure("can_apply", agent, action):
+            can_apply = action.can_apply(model, agent)
+        if can_apply:
+            with self.measure("apply", agent, action):
+                action.apply(model, agent)
+        with self.measure("Perception.from_agent", agent):
+            return Perception.from_agent(model, agent)
+
+    def reset(self) -> None:
+        self.stats.clear()
+        self.events.clear()
+        self.origin = time.perf_counter()
+
+    def totals(self, by: str = "phase") -> dict[tuple[str, ...], tuple[float, int]]:
+        """Total time and calls by "phase", "owner" (phase and agent class) or "action" (phase and action class)."""
+        fields = {"phase": (0,), "owner": (0, 1), "action": (0, 2)}[by]
+        totals: dict[tuple[str, ...], tuple[float, int]] = {}
+        for key, (total, calls) in self.stats.items():
+            group = tuple(key[field] for field in fields)
+            previous_total, previous_calls = totals.get(group, (0.0, 0))
+            totals[group] = (previous_total + total, previous_calls + calls)
+        return totals
+
+    def summary(self) -> str:
+        step_time = self.totals().get(("step",), (0.0, 0))[0]
+        lines = [f"{'phase':<28} {'by':<36} {'calls':>9} {'total ms':>10} {'mean us':>9} {'% step':>7}"]
+
+        def add_line(phase: str, by: str, total: float, calls: int) -> None:
+            share = f"{100 * total / step_time:6.1f}%" if step_time > 0 else ""
+            lines.append(f"{phase:<28} {by:<36} {calls:>9} {1e3 * total:>10.2f} {1e6 * total / calls:>9.2f} {share:>7}")
+
+        for (phase,), (total, calls) in sorted(self.totals().items(), key=lambda item: -item[1][0]):
+            add_line(phase, "", total, calls)
+            for by in ("owner", "action"):
+                for (group_phase, name), (group_total, group_calls) in sorted(
+                    self.totals(by).items(), key=lambda item: -item[1][0]
+                ):
+                    if group_phase == phase and name:
+                        add_line("", name, group_total, group_calls)
+
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Writes the events in the Chrome trace format (open it in chrome://tracing or https://ui.perfetto.dev)."""
+        assert self.trace, "The profiler was created without trace=True"
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
@@ -4,26 +4,229 @@ Members: Aymeric Conti, Pierre Jourdin
 Date: 14/03/2025
 """
 
-from typing import cast
-from mesa.space import MultiGridContent
+import gzip
+import json
+import mmap
+import queue
+import struct
+import threading
+import numpy as np
 
-from agent import Agent
-from model import RobotMission
-from objects import Waste
-from utils import Color
+from typing import IO, Any, Iterator, Sequence
 
+from model import RobotMission, model_to_n_waste
 
-def model_to_n_waste(model: RobotMission) -> dict[Color, int]:
-    n_waste = {Color.GREEN: 0, Color.YELLOW: 0, Color.RED: 0}
+__all__ = [
+    "model_to_n_waste",
+    "Recorder",
+    "BinaryRecorder",
+    "BinaryRecording",
+    "iter_recording",
+    "read_recording",
+]
 
-    for cells, coords in model.grid.coord_iter():
-        cells = cast(MultiGridContent, cells)
 
-        for cell in cells:
-            if isinstance(cell, Waste):
-                n_waste[cell.color] += 1
-            elif isinstance(cell, Agent):
-                for waste in cell.inventory:
-                    n_waste[waste.color] += 1
+def open_recording(path: str, mode: str) -> IO[bytes]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "b")  # type: ignore
+    return open(path, mode + "b")
 
-    return n_waste
+
+class Recorder:
+    """
+    Streams the steps of a simulation to a JSON Lines file (gzipped if the path ends with ".gz") while it runs.
+
+    The first line is a header {"width", "height", "agents_color"}, then every line is a step as returned by
+    `RobotMission.serialize`. The recorder replaces `model.history`, so the model keeps no step in memory,
+    and the encoding and writing are done by a background thread so they overlap with the simulation.
+    """
+
+    def __init__(self, path: str, model: RobotMission, max_pending_steps: int = 256) -> None:
+        self.path = path
+        self.n_steps = 0
+        self._file = open_recording(path, "w")
+        self._queue: queue.Queue[dict[str, Any] | None] = queue.Queue(max_pending_steps)
+        self._error: BaseException | None = None
+        self._closed = False
+
+        header = {
+            "width": model.width,
+            "height": model.height,
+            "agents_color": [{"id": agent.unique_id, "color": agent.color} for agent in model.get_agents()],
+        }
+        self._file.write(self.encode_header(header))
+
+        self._writer = threading.Thread(target=self._write_loop, name=f"Recorder({path})", daemon=True)
+        self._writer.start()
+
+        model.history = self
+
+    def encode_header(self, header: dict[str, Any]) -> bytes:
+        return json.dumps(header, separators=(",", ":")).encode() + b"\n"
+
+    def encode_step(self, state: dict[str, Any]) -> bytes:
+        return json.dumps(state, separators=(",", ":")).encode() + b"\n"
+
+    def finalize(self) -> None:
+        """Called by the writer thread once every step has been written."""
+
+    def _write_loop(self) -> None:
+        try:
+            while (state := self._queue.get()) is not None:
+                self._file.write(self.encode_step(state))
+            self.finalize()
+        except BaseException as error:
+            self._error = error
+            # Keep consuming so the simulation never blocks on a full queue
+            while self._queue.get() is not None:
+                pass
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise RuntimeError(f"Could not write the recording {self.path}") from self._error
+
+    def append(self, state: dict[str, Any]) -> None:
+        self._raise_if_failed()
+        assert not self._closed, "Trying to record a step after the recorder was closed"
+        self._queue.put(state)
+        self.n_steps += 1
+
+    def __len__(self) -> int:
+        return self.n_steps
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        self._raise_if_failed()
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def iter_recording(path: str) -> tuple[dict[str, Any], Iterator[dict[str, Any]]]:
+    """Returns the header of a recording made by `Recorder` and a lazy iterator over its steps."""
+    f = open_recording(path, "r")
+    header = json.loads(f.readline())
+
+    def steps() -> Iterator[dict[str, Any]]:
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    return header, steps()
+
+
+def read_recording(path: str) -> dict[str, Any]:
+    """Loads a recording made by `Recorder` in the same format as `RobotMission.to_dict`."""
+    header, steps = iter_recording(path)
+    return {**header, "steps": list(steps)}
+
+
+MAGIC = b"RMREC\x00\x01\x00"
+INVENTORY_SLOTS = 2  # an agent never holds more than 2 wastes
+
+_step_header = struct.Struct("<II")  # n_agents, n_wastes
+_footer = struct.Struct("<QQ8s")  # index offset, n_steps, magic
+agent_dtype = np.dtype([("id", "<i4"), ("x", "<i2"), ("y", "<i2"), ("inventory", "u1", (INVENTORY_SLOTS,))])
+waste_dtype = np.dtype([("x", "<i2"), ("y", "<i2"), ("color", "u1")])
+
+
+class BinaryRecorder(Recorder):
+    """
+    Streams a simulation to a binary file that can be read one step at a time (see `BinaryRecording`).
+
+    Layout:
+    - MAGIC, uint32 length and JSON bytes of the header
+    - for every step: uint32 n_agents, uint32 n_wastes, the agents as `agent_dtype` records,
+      the wastes as `waste_dtype` records (inventories are padded with 0)
+    - the index: uint64 offset of every step, plus the offset of the end of the last step
+    - the footer: uint64 offset of the index, uint64 number of steps, MAGIC
+    """
+
+    def __init__(self, path: str, model: RobotMission, max_pending_steps: int = 256) -> None:
+        assert not path.endswith(".gz"), "Binary recordings are memory-mapped, they cannot be compressed"
+        self._offsets: list[int] = []
+        self._position = 0
+        super().__init__(path, model, max_pending_steps)
+
+    def _track(self, data: bytes) -> bytes:
+        self._position += len(data)
+        return data
+
+    def encode_header(self, header: dict[str, Any]) -> bytes:
+        encoded = json.dumps(header, separators=(",", ":")).encode()
+        return self._track(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+
+    def encode_step(self, state: dict[str, Any]) -> bytes:
+        agents = np.zeros(len(state["agents"]), dtype=agent_dtype)
+        for i, agent in enumerate(state["agents"]):
+            assert len(agent["inventory"]) <= INVENTORY_SLOTS, "Inventory too large for the binary format"
+            agents[i] = (agent["id"], agent["x"], agent["y"], (*agent["inventory"], 0, 0)[:INVENTORY_SLOTS])
+
+        wastes = np.array([(waste["x"], waste["y"], waste["color"]) for waste in state["wastes"]], dtype=waste_dtype)
+
+        self._offsets.append(self._position)
+        return self._track(_step_header.pack(len(agents), len(wastes)) + agents.tobytes() + wastes.tobytes())
+
+    def finalize(self) -> None:
+        index = np.array(self._offsets + [self._position], dtype="<u8")
+        self._file.write(index.tobytes())
+        self._file.write(_footer.pack(self._position, len(self._offsets), MAGIC))
+
+
+class BinaryRecording(Sequence[dict[str, Any]]):
+    """
+    Memory-mapped reader of a `BinaryRecorder` file: only the requested step is decoded,
+    so accessing the last step of a long recording costs the same as accessing the first one.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._buffer[: len(MAGIC)] != MAGIC or self._buffer[-len(MAGIC) :] != MAGIC:
+            raise ValueError(f"{path} is not a complete binary recording")
+
+        index_offset, n_steps, _ = _footer.unpack_from(self._buffer, len(self._buffer) - _footer.size)
+        self.offsets = np.frombuffer(self._buffer, dtype="<u8", count=n_steps + 1, offset=index_offset)
+
+        (header_size,) = struct.unpack_from("<I", self._buffer, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header: dict[str, Any] = json.loads(self._buffer[start : start + header_size])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> dict[str, Any]:  # type: ignore[override]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("recording index out of range")
+
+        offset = int(self.offsets[index])
+        n_agents, n_wastes = _step_header.unpack_from(self._buffer, offset)
+        offset += _step_header.size
+        agents = np.frombuffer(self._buffer, dtype=agent_dtype, count=n_agents, offset=offset)
+        offset += n_agents * agent_dtype.itemsize
+        wastes = np.frombuffer(self._buffer, dtype=waste_dtype, count=n_wastes, offset=offset)
+
+        return {
+            "step": index,
+            "agents": [
+                {"id": agent_id, "x": x, "y": y, "inventory": [int(color) for color in inventory if color != 0]}
+                for agent_id, x, y, inventory in agents.tolist()
+            ],
+            "wastes": [{"x": x, "y": y, "color": color} for x, y, color in wastes.tolist()],
+        }
+
+    def close(self) -> None:
+        del self.offsets
+        self._buffer.close()
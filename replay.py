@@ -7,12 +7,14 @@ Date: 15/03/2025
 import json
 import solara
 
-from typing import Any
+from typing import Any, Sequence
 from mesa.visualization import SolaraViz
 from action import Action, Wait
 from server import make_graphs
 
 from agent import Agent
+from history import compute_delta, steps_from_dict
+from record import BinaryRecording, read_recording
 from model import RobotMission
 from objects import Waste
 from utils import Color
@@ -33,8 +35,18 @@ class ReplayModel(RobotMission):
     """Fake model to simulate a Mesa model from JSON data."""
 
     def __init__(self, json_path: str = "simulations/10000.json"):
-        with open(json_path, "r") as f:
-            self.replay_data = json.load(f)
+        self.replay_steps: Sequence[dict[str, Any]]
+        if json_path.endswith(".rec"):
+            # Binary recordings are memory-mapped: only the displayed step is decoded
+            recording = BinaryRecording(json_path)
+            self.replay_data, self.replay_steps = recording.header, recording
+        else:
+            if json_path.endswith((".jsonl", ".jsonl.gz")):
+                self.replay_data = read_recording(json_path)
+            else:
+                with open(json_path, "r") as f:
+                    self.replay_data = json.load(f)
+            self.replay_steps = steps_from_dict(self.replay_data)
 
         super().__init__(self.replay_data["width"], self.replay_data["height"], 0, 0, 0, 0, 0, 0)
 
@@ -46,36 +58,60 @@ class ReplayModel(RobotMission):
         for agent in self.id_to_agent.values():
             self.grid.place_agent(agent, (0, 0))
 
+        # What is currently drawn, so that changing step only applies the difference
+        self.displayed_step: dict[str, Any] = {"agents": [], "wastes": []}
+        self.waste_at: dict[tuple[int, int], Waste] = {}
+        self.spare_wastes: list[Waste] = []  # Wastes neither on the grid nor in an inventory, reused instead of recreated
+
         step_index.set(0)
         self.reset_map()
 
     def get_current_step_data(self) -> dict[str, Any]:
-        return self.replay_data["steps"][step_index.value]
+        return self.replay_steps[step_index.value]
 
     def step(self) -> None:
-        if step_index.value >= len(self.replay_data["steps"]) - 1:
+        if step_index.value >= len(self.replay_steps) - 1:
             return
 
         step_index.set(step_index.value + 1)
         self.reset_map()
 
+    def take_waste(self, color: Color) -> Waste:
+        if len(self.spare_wastes) == 0:
+            return Waste(self, color)
+
+        waste = self.spare_wastes.pop()
+        waste.color = color
+        return waste
+
     def reset_map(self):
+        """Moves the map from the displayed step to the current step by applying only what changed between them."""
         step_data = self.get_current_step_data()
+        delta = compute_delta(self.displayed_step, step_data)
 
-        for waste in self.agents_by_type.get(Waste, []):
-            if waste.pos is not None:
-                self.grid.remove_agent(waste)
-
-        for waste_dict in step_data["wastes"]:
-            waste = Waste(self, Color(waste_dict["color"]))
-            self.grid.place_agent(waste, (waste_dict["x"], waste_dict["y"]))
+        for x, y in delta["removed_wastes"]:
+            waste = self.waste_at.pop((x, y))
+            self.grid.remove_agent(waste)
+            self.spare_wastes.append(waste)
 
-        for agent_dict in step_data["agents"]:
+        for agent_dict in delta["agents"]:
             agent = self.id_to_agent[agent_dict["id"]]
-            self.grid.move_agent(agent, (agent_dict["x"], agent_dict["y"]))
-            agent.inventory.clear()
-            for waste_color in agent_dict["inventory"]:
-                agent.inventory.add(Waste(self, Color(waste_color)))
+            pos = (agent_dict["x"], agent_dict["y"])
+            if agent.pos != pos:
+                self.grid.move_agent(agent, pos)
+
+            if [waste.color for waste in agent.inventory] != agent_dict["inventory"]:
+                self.spare_wastes.extend(agent.inventory)
+                agent.inventory.clear()
+                for waste_color in agent_dict["inventory"]:
+                    agent.inventory.add(self.take_waste(Color(waste_color)))
+
+        for waste_dict in delta["added_wastes"]:
+            pos = (waste_dict["x"], waste_dict["y"])
+            self.waste_at[pos] = self.take_waste(Color(waste_dict["color"]))
+            self.grid.place_agent(self.waste_at[pos], pos)
+
+        self.displayed_step = step_data
 
 
 model = solara.reactive(ReplayModel())
@@ -84,9 +120,9 @@ model = solara.reactive(ReplayModel())
 @solara.core.component
 def SimulationReplay():
     """Solara UI for replaying the recorded simulation."""
-    solara.Text(f"Step {step_index.value} / {len(model.value.replay_data) - 1}")
+    solara.Text(f"Step {step_index.value} / {len(model.value.replay_steps) - 1}")
     solara.Button("Previous", on_click=lambda: step_index.set(max(0, step_index.value - 1)))
-    solara.Button("Next", on_click=lambda: step_index.set(min(len(model.value.replay_data) - 1, step_index.value + 1)))
+    solara.Button("Next", on_click=lambda: step_index.set(min(len(model.value.replay_steps) - 1, step_index.value + 1)))
 
 
 page = SolaraViz(
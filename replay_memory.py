@@ -0,0 +1,482 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+import json
+import math
+import numpy as np
+import os
+import torch
+
+from typing import Any, TypeVar
+
+from observation import N_DISCRETE_FEATURES
+
+
+class Transition:
+    def __init__(
+        self,
+        observations: torch.Tensor,
+        state: torch.Tensor,
+        hiddens: tuple[torch.Tensor, torch.Tensor],
+        actions: torch.Tensor,
+        reward: torch.Tensor,
+        done: bool,
+    ):
+        self.observations = observations
+        self.state = state
+        self.hiddens = hiddens
+        self.actions = actions
+        self.reward = reward
+        self.done = done
+
+
+class Game:
+    def __init__(self, transitions: list[Transition], final_observation: torch.Tensor, final_state: torch.Tensor) -> None:
+        self.observations = torch.stack([transition.observations for transition in transitions] + [final_observation])
+        self.state = torch.stack([transition.state for transition in transitions] + [final_state])
+        self.hiddens = (
+            torch.stack([transition.hiddens[0] for transition in transitions], dim=1),
+            torch.stack([transition.hiddens[1] for transition in transitions], dim=1),
+        )
+        self.actions = torch.stack([transition.actions for transition in transitions])
+        self.rewards = torch.stack([transition.reward for transition in transitions])
+        self.done = torch.tensor([transition.done for transition in transitions], dtype=torch.float32)
+        self.length = len(transitions)
+
+
+class Batch:
+    """
+    Sequences of `seq_size` steps sampled from the replay memory:
+    - observations, next_observations: (batch_size, n_agents, seq_size, observation_size)
+    - states, next_states: (batch_size, state_size, seq_size, width, height)
+    - hiddens, next_hiddens: hidden states of the agents before the first (second) step,
+      (num_lstm_layers, batch_size, n_agents, hidden_size) each
+    - actions, rewards: (batch_size, n_agents, seq_size)
+    - dones: (batch_size, seq_size)
+    - mask: (batch_size, seq_size), 1 for the steps the loss is computed on, 0 for padding and burn-in steps
+    - indices: (batch_size,) sequence ids to give back to `ReplayMemory.update_priorities`
+    - weights: (batch_size,) importance-sampling weights of the sequences in the loss
+    """
+
+    def __init__(
+        self,
+        observations: torch.Tensor,
+        states: torch.Tensor,
+        hiddens: tuple[torch.Tensor, torch.Tensor],
+        actions: torch.Tensor,
+        next_observations: torch.Tensor,
+        next_states: torch.Tensor,
+        next_hiddens: tuple[torch.Tensor, torch.Tensor],
+        rewards: torch.Tensor,
+        dones: torch.Tensor,
+        mask: torch.Tensor,
+        indices: torch.Tensor,
+        weights: torch.Tensor,
+    ) -> None:
+        self.observations = observations
+        self.states = states
+        self.hiddens = hiddens
+        self.actions = actions
+        self.next_observations = next_observations
+        self.next_states = next_states
+        self.next_hiddens = next_hiddens
+        self.rewards = rewards
+        self.dones = dones
+        self.mask = mask
+        self.indices = indices
+        self.weights = weights
+
+
+# bits -> (256, 8 // bits) values packed in each byte
+_unpack_tables: dict[int, np.ndarray] = {}
+
+
+def pack_bits(values: torch.Tensor, bits: int) -> torch.Tensor:
+    """Packs the last dimension of `values`, integers in [0, 2 ** bits), into uint8 holding 8 // bits values each."""
+    assert 8 % bits == 0, "Values must be packed on 1, 2, 4 or 8 bits"
+    per_byte = 8 // bits
+    n = values.shape[-1]
+    padded = torch.zeros((*values.shape[:-1], -(-n // per_byte) * per_byte), dtype=torch.uint8)
+    padded[..., :n] = values
+    shifts = torch.arange(0, 8, bits, dtype=torch.uint8)
+    return (padded.view(*values.shape[:-1], -1, per_byte) << shifts).sum(-1, dtype=torch.uint8)
+
+
+def unpack_bits(packed: torch.Tensor, bits: int, n: int) -> torch.Tensor:
+    """
+    Inverse of `pack_bits`, the `n` values packed in the last dimension of `packed` as float32.
+    Each byte is looked up in a table of its 8 // bits values, which decodes and converts them in a single pass.
+    """
+    table = _unpack_tables.get(bits)
+    if table is None:
+        codes = np.arange(256, dtype=np.uint8)[:, None] >> np.arange(0, 8, bits, dtype=np.uint8)
+        table = _unpack_tables[bits] = (codes & ((1 << bits) - 1)).astype(np.float32)
+    values = torch.from_numpy(np.take(table, packed.numpy(), axis=0))
+    return values.view(*packed.shape[:-1], -1)[..., :n]
+
+
+M = TypeVar("M", bound="ReplayMemory")
+
+
+class ReplayMemory:
+    """
+    Ring buffer of games stored in preallocated arrays, one per field, of shape (capacity, max_length (+ 1), ...).
+    They are allocated when the first game is pushed, from its shapes. Sampling a batch is a single indexing per field.
+
+    With a `directory`, the arrays are memory-mapped .npy files in it: the buffer can be larger than the RAM, only the
+    pages in use stay in memory, and `save` then `load` restore it after the process stops. Games pushed after the last
+    `save` are either kept or overwritten again after a `load`, each slot always holds one game and its length.
+
+    Observations and states are stored compactly and made dense float tensors again when sampled: the discrete features
+    of the observations as uint8, next to their float positions, and the states (small counts) on `state_bits` bits.
+    """
+
+    def __init__(self, capacity: int, max_length: int = 200, directory: str | None = None, state_bits: int = 2):
+        """
+        Args:
+            state_bits: Bits per value of the states, 2 holds the inventory counts (at most 2) of `RobotMission.to_tensor`.
+        """
+        self.capacity = capacity
+        self.max_length = max_length
+        self.directory = directory
+        self.state_bits = state_bits
+        self.state_shape: tuple[int, ...] | None = None  # (state_size, width, height)
+        self.position = 0
+        self.size = 0
+        self.arrays: dict[str, np.ndarray] = {}  # the numpy arrays (or memmaps) the fields are views of
+
+        self.observations: torch.Tensor  # (capacity, max_length + 1, n_agents, N_DISCRETE_FEATURES), uint8
+        self.positions: torch.Tensor  # (capacity, max_length + 1, n_agents, observation_size - N_DISCRETE_FEATURES)
+        self.states: torch.Tensor  # (capacity, max_length + 1, packed state size), uint8
+        self.hiddens: torch.Tensor  # (2, capacity, max_length, num_lstm_layers, n_agents, hidden_size), float16
+        self.actions: torch.Tensor  # (capacity, max_length, n_agents), uint8
+        self.rewards: torch.Tensor  # (capacity, max_length, n_agents)
+        self.dones: torch.Tensor  # (capacity, max_length), bool
+        self.lengths: torch.Tensor  # (capacity,)
+        self.allocated = False
+
+    def fields(self, game: Game) -> dict[str, tuple[tuple[int, ...], np.dtype]]:
+        """Shape and dtype of the array of each field, to store games like `game`."""
+        n_layers, _, n_agents, hidden_size = game.hiddens[0].shape
+        capacity, length = self.capacity, self.max_length
+        n_positions = game.observations.shape[-1] - N_DISCRETE_FEATURES
+        state_bytes = -(-game.state[0].numel() * self.state_bits // 8)
+        return {
+            "observations": ((capacity, length + 1, n_agents, N_DISCRETE_FEATURES), np.dtype(np.uint8)),
+            "positions": ((capacity, length + 1, n_agents, n_positions), np.dtype(np.float32)),
+            "states": ((capacity, length + 1, state_bytes), np.dtype(np.uint8)),
+            "hiddens": ((2, capacity, length, n_layers, n_agents, hidden_size), np.dtype(np.float16)),
+            "actions": ((capacity, length, n_agents), np.dtype(np.uint8)),
+            "rewards": ((capacity, length, n_agents), np.dtype(np.float32)),
+            "dones": ((capacity, length), np.dtype(np.bool_)),
+            "lengths": ((capacity,), np.dtype(np.int64)),
+        }
+
+    def allocate(self, game: Game) -> None:
+        self.state_shape = tuple(game.state.shape[1:])
+        self.open_fields(self.fields(game), mode="w+")
+
+    def open_fields(self, fields: dict[str, tuple[tuple[int, ...], np.dtype]], mode: str) -> None:
+        """Creates (mode "w+") or opens (mode "r+", memory-mapped only) the arrays of `fields`."""
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        for name, (shape, dtype) in fields.items():
+            if self.directory is None:
+                array = np.zeros(shape, dtype)
+            else:
+                path = os.path.join(self.directory, f"{name}.npy")
+                array = np.lib.format.open_memmap(path, mode=mode, dtype=dtype, shape=shape)
+                assert array.shape == shape and array.dtype == dtype, f"{path} does not match the memory"
+            self.arrays[name] = array
+            setattr(self, name, torch.from_numpy(array))
+        self.allocated = True
+
+    def config(self) -> dict[str, Any]:
+        """Arguments of the constructor, saved with the memory."""
+        return {"capacity": self.capacity, "max_length": self.max_length, "state_bits": self.state_bits}
+
+    def save(self, directory: str | None = None) -> None:
+        """
+        Writes the memory to `directory` (its own directory by default): the arrays, then memory.json with everything
+        else, which is replaced last so that an interrupted save leaves the previous one readable.
+        """
+        directory = directory or self.directory
+        assert directory is not None, "A directory is needed to save an in-memory replay memory"
+        os.makedirs(directory, exist_ok=True)
+
+        for name, array in self.arrays.items():
+            path = os.path.join(directory, f"{name}.npy")
+            if isinstance(array, np.memmap) and os.path.exists(path) and os.path.samefile(array.filename, path):
+                array.flush()
+            else:
+                np.save(path, array)
+
+        metadata = {
+            "class": type(self).__name__,
+            "config": self.config(),
+            "position": self.position,
+            "size": self.size,
+            "fields": {name: [list(array.shape), array.dtype.str] for name, array in self.arrays.items()},
+            "state": self.state(directory),
+        }
+        path = os.path.join(directory, "memory.json")
+        with open(path + ".tmp", "w") as file:
+            json.dump(metadata, file, indent=4)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls: type[M], directory: str) -> M:
+        """Memory saved in `directory`, memory-mapped from its files (later pushes write into them)."""
+        with open(os.path.join(directory, "memory.json")) as file:
+            metadata = json.load(file)
+        assert metadata["class"] == cls.__name__, f"{directory} holds a {metadata['class']}, not a {cls.__name__}"
+
+        memory = cls(**metadata["config"], directory=directory)
+        fields = {name: (tuple(shape), np.dtype(dtype)) for name, (shape, dtype) in metadata["fields"].items()}
+        if fields:
+            memory.open_fields(fields, mode="r+")
+        memory.position = metadata["position"]
+        memory.size = metadata["size"]
+        memory.load_state(metadata["state"], directory)
+        return memory
+
+    def state(self, directory: str) -> dict[str, Any]:
+        """What is needed besides the arrays and the config, as JSON (larger data can be written to `directory`)."""
+        return {"state_shape": self.state_shape}
+
+    def load_state(self, state: dict[str, Any], directory: str) -> None:
+        self.state_shape = None if state["state_shape"] is None else tuple(state["state_shape"])
+
+    def push(self, game: Game):
+        assert game.length <= self.max_length, f"Games longer than {self.max_length} steps do not fit in the memory"
+        if not self.allocated:
+            self.allocate(game)
+
+        i, length = self.position, game.length
+        discrete_features = game.observations[..., :N_DISCRETE_FEATURES]
+        states = game.state.flatten(1)
+        assert (discrete_features == discrete_features.to(torch.uint8)).all(), "Discrete features must be in [0, 255]"
+        assert (states == states.to(torch.uint8)).all() and states.max() < 1 << self.state_bits, (
+            f"State values must be integers in [0, {1 << self.state_bits})"
+        )
+        self.observations[i, : length + 1] = discrete_features
+        self.positions[i, : length + 1] = game.observations[..., N_DISCRETE_FEATURES:]
+        self.states[i, : length + 1] = pack_bits(states.to(torch.uint8), self.state_bits)
+        self.hiddens[0, i, :length] = game.hiddens[0].transpose(0, 1)
+        self.hiddens[1, i, :length] = game.hiddens[1].transpose(0, 1)
+        self.actions[i, :length] = game.actions
+        self.rewards[i, :length] = game.rewards
+        self.dones[i, :length] = game.done
+        self.lengths[i] = length
+
+        self.position = (self.position + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size: int, seq_size: int, burn_in: int = 0) -> Batch:
+        """
+        Samples `batch_size` distinct games and a window of `burn_in + seq_size` steps in each of them.
+
+        Windows are drawn uniformly among the ones that fit in their game. A game shorter than the window is taken
+        from its start and padded by repeating its last step, padding steps are masked.
+        The first `burn_in` steps of a window are also masked, unless it starts with the game: they only rebuild the
+        hidden states of the agents, which are stale since they were recorded with older networks.
+        """
+        assert seq_size <= 100, "Sequence size must be less than or equal to 100"
+        assert batch_size <= self.size, f"Cannot sample {batch_size} games from a memory of {self.size} games"
+
+        window = burn_in + seq_size
+        games = torch.randperm(self.size)[:batch_size]
+        starts = (torch.rand(batch_size) * (torch.clamp(self.lengths[games] - window, min=0) + 1)).long()
+        return self.build_batch(games, starts, seq_size, burn_in, torch.ones((batch_size,)))
+
+    def build_batch(
+        self, games: torch.Tensor, starts: torch.Tensor, seq_size: int, burn_in: int, weights: torch.Tensor
+    ) -> Batch:
+        """Batch of the windows of `burn_in + seq_size` steps starting at step `starts` of the slots `games`."""
+        window = burn_in + seq_size
+        lengths = self.lengths[games]
+
+        steps = starts[:, None] + torch.arange(window + 1)  # (batch_size, window + 1)
+        # Steps past the end of a game repeat its last transition (and its final observation and state)
+        step_rows = games[:, None] * (self.max_length + 1) + torch.minimum(steps, lengths[:, None])
+        transition_rows = games[:, None] * self.max_length + torch.minimum(steps[:, :-1], lengths[:, None] - 1)
+
+        mask = (steps[:, :-1] < lengths[:, None]).float()
+        mask[starts > 0, :burn_in] = 0
+
+        all_observations = torch.cat(
+            [self.gather(self.observations, step_rows).float(), self.gather(self.positions, step_rows)], dim=-1
+        ).transpose(1, 2)
+        assert self.state_shape is not None
+        states = unpack_bits(self.gather(self.states, step_rows), self.state_bits, math.prod(self.state_shape))
+        all_states = states.reshape(*step_rows.shape, *self.state_shape).transpose(1, 2)
+        hiddens = self.hiddens[:, games, starts].transpose(1, 2).float()  # (2, num_lstm_layers, batch_size, ...)
+        # The hidden state after the last step is not stored, it is only used for terminal steps
+        next_hiddens = self.hiddens[:, games, torch.minimum(starts + 1, lengths - 1)].transpose(1, 2).float()
+
+        return Batch(
+            observations=all_observations[:, :, :-1],
+            states=all_states[:, :, :-1],
+            hiddens=(hiddens[0], hiddens[1]),
+            actions=self.gather(self.actions, transition_rows).transpose(1, 2).long(),
+            next_observations=all_observations[:, :, 1:],
+            next_states=all_states[:, :, 1:],
+            next_hiddens=(next_hiddens[0], next_hiddens[1]),
+            rewards=self.gather(self.rewards, transition_rows).transpose(1, 2),
+            dones=self.gather(self.dones, transition_rows).float(),
+            mask=mask,
+            indices=games * self.max_length + starts,
+            weights=weights,
+        )
+
+    @staticmethod
+    def gather(field: torch.Tensor, rows: torch.Tensor) -> torch.Tensor:
+        """field[i, t] for every flat index i * field.shape[1] + t of `rows`, in the shape of `rows`."""
+        flat = field.view(-1, *field.shape[2:])
+        return flat.index_select(0, rows.flatten()).view(*rows.shape, *field.shape[2:])
+
+    def update_priorities(self, indices: torch.Tensor, td_errors: torch.Tensor, mask: torch.Tensor) -> None:
+        """
+        Called after a training step with the absolute TD errors (batch_size, seq_size) of the sampled sequences
+        and the mask of the batch, uniform sampling ignores them.
+        """
+
+    def __len__(self):
+        return self.size
+
+
+class SumTree:
+    """
+    Binary tree over `capacity` non-negative leaf values where each node holds the sum of its children,
+    so setting leaves and finding the leaf where a cumulative sum falls are O(log capacity).
+    Both operations take arrays and walk all their entries down (or up) the tree together, one level at a time.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.n_leaves = 1 << max(0, capacity - 1).bit_length()
+        self.depth = self.n_leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.n_leaves)  # nodes[1] is the root, leaf i is nodes[n_leaves + i]
+
+    @property
+    def total(self) -> float:
+        return float(self.nodes[1])
+
+    def get(self, leaves: np.ndarray) -> np.ndarray:
+        return self.nodes[self.n_leaves + leaves]
+
+    def set(self, leaves: np.ndarray, values: np.ndarray) -> None:
+        nodes = self.n_leaves + np.asarray(leaves)
+        self.nodes[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, cumsums: np.ndarray) -> np.ndarray:
+        """Leaves i such that sum(leaves[:i]) <= cumsum < sum(leaves[: i + 1]), never a leaf of value 0."""
+        nodes = np.ones(len(cumsums), dtype=np.int64)
+        cumsums = np.array(cumsums, dtype=np.float64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sums = self.nodes[left]
+            # Rounding errors can leave a cumsum past the sum of a subtree, it then stays in the non-empty child
+            go_right = ((cumsums >= left_sums) & (self.nodes[left + 1] > 0)) | (left_sums <= 0)
+            cumsums -= np.where(go_right, left_sums, 0)
+            nodes = left + go_right
+        return nodes - self.n_leaves
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    `ReplayMemory` sampling the sequences (game, start step) proportionally to their priority ** alpha,
+    as in prioritized experience replay (Schaul et al.) applied to sequences (R2D2, Kapturowski et al.).
+
+    Every window of `window` steps fitting in a game (the first one only if the game is shorter) is a leaf of a
+    `SumTree`, sequence id `slot * max_length + start`. New sequences get the highest priority seen so far,
+    `update_priorities` sets the ones of the sampled sequences from their TD errors.
+    The batch weights correct the bias of this sampling: (size * P(sequence)) ** -beta, divided by their maximum.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        max_length: int = 200,
+        window: int = 50,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        eta: float = 0.9,
+        epsilon: float = 1e-6,
+        directory: str | None = None,
+        state_bits: int = 2,
+    ):
+        """
+        Args:
+            window: Number of steps (burn-in included) of the sampled sequences, sets which starts can be drawn.
+            eta: Priority of a sequence is eta * max + (1 - eta) * mean of its absolute TD errors.
+            epsilon: Added to the priorities so that no sequence stops being sampled.
+        """
+        super().__init__(capacity, max_length, directory, state_bits)
+        self.window = window
+        self.alpha = alpha
+        self.beta = beta
+        self.eta = eta
+        self.epsilon = epsilon
+        self.max_priority = 1.0
+        self.tree = SumTree(capacity * max_length)
+        self.n_sequences = 0
+
+    def config(self) -> dict[str, Any]:
+        return {
+            **super().config(),
+            "window": self.window,
+            "alpha": self.alpha,
+            "beta": self.beta,
+            "eta": self.eta,
+            "epsilon": self.epsilon,
+        }
+
+    def state(self, directory: str) -> dict[str, Any]:
+        np.save(os.path.join(directory, "priorities.npy"), self.tree.nodes)
+        return {**super().state(directory), "max_priority": self.max_priority, "n_sequences": self.n_sequences}
+
+    def load_state(self, state: dict[str, Any], directory: str) -> None:
+        super().load_state(state, directory)
+        self.tree.nodes = np.load(os.path.join(directory, "priorities.npy"))
+        self.max_priority = state["max_priority"]
+        self.n_sequences = state["n_sequences"]
+
+    def push(self, game: Game):
+        first = self.position * self.max_length
+        # The sequences of the game this one replaces, read from the tree since a loaded slot may have been rewritten
+        old_sequences = first + np.flatnonzero(self.tree.get(np.arange(first, first + self.max_length)))
+        self.tree.set(old_sequences, 0)
+        super().push(game)
+
+        n_starts = max(1, game.length - self.window + 1)
+        self.tree.set(np.arange(first, first + n_starts), self.max_priority**self.alpha)
+        self.n_sequences += n_starts - len(old_sequences)
+
+    def sample(self, batch_size: int, seq_size: int, burn_in: int = 0) -> Batch:
+        """Like `ReplayMemory.sample`, but a game can appear several times (at different starts or not)."""
+        assert seq_size <= 100, "Sequence size must be less than or equal to 100"
+        assert self.size > 0, "Cannot sample from an empty memory"
+
+        # One draw per stratum of the total priority, so that the batch covers the whole distribution
+        total = self.tree.total
+        cumsums = (np.arange(batch_size) + np.random.rand(batch_size)) * (total / batch_size)
+        sequences = self.tree.find(cumsums)
+        probabilities = self.tree.get(sequences) / total
+
+        weights = (self.n_sequences * probabilities) ** -self.beta
+        weights = torch.from_numpy(weights / weights.max()).float()
+        sequences = torch.from_numpy(sequences)
+        return self.build_batch(sequences // self.max_length, sequences % self.max_length, seq_size, burn_in, weights)
+
+    def update_priorities(self, indices: torch.Tensor, td_errors: torch.Tensor, mask: torch.Tensor) -> None:
+        td_errors = (td_errors * mask).double()
+        mean_td_errors = td_errors.sum(1) / mask.sum(1).clamp(min=1)
+        priorities = (self.eta * td_errors.max(1)[0] + (1 - self.eta) * mean_td_errors).numpy() + self.epsilon
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.set(indices.numpy(), priorities**self.alpha)
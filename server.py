@@ -14,7 +14,7 @@ from mesa.visualization import SolaraViz, make_space_component, make_plot_compon
 
 from model import RobotMission
 from agent import Agent
-from objects import Dump, Radioactivity, Waste
+from objects import Waste
 from utils import Color
 from run import model, model_params
 
@@ -22,15 +22,10 @@ from run import model, model_params
 def post_process(model: solara.Reactive[RobotMission], ax: Axes) -> None:
     grid = np.zeros((model.value.height, model.value.width, 3))
     for x, y in product(range(model.value.width), range(model.value.height)):
-        cells = [cell for cell in model.value.grid.get_cell_list_contents([(x, y)]) if isinstance(cell, Radioactivity)]
-        assert len(cells) == 1, "Multiple or no radioactivity in the cell"
-
-        radioactivity = cells[0]
-
-        if isinstance(radioactivity, Dump):
+        if (x, y) == model.value.dump_pos:
             grid[y, x] = (0.8, 0.5, 0.5)
         else:
-            grid[y, x] = radioactivity.color.to_light_rgb()
+            grid[y, x] = model.value.get_color_at((x, y)).to_light_rgb()
 
     ax.imshow(grid, origin="lower", extent=(-0.5, model.value.width - 0.5, -0.5, model.value.height - 0.5), zorder=0)
 
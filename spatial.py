@@ -0,0 +1,127 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+from __future__ import annotations
+
+from typing import Iterator
+
+from utils import Color, Position
+
+
+class SpatialIndex:
+    """
+    Positions of agents bucketed per color in square cells of `cell_size` x `cell_size`,
+    so nearest-of-color and within-radius queries only look at the buckets around the query position.
+    Distances are Manhattan distances, ties are broken by insertion order like `min` over a dict.
+    """
+
+    def __init__(self, cell_size: int = 5) -> None:
+        assert cell_size >= 1, "The cell size must be at least 1"
+        self.cell_size = cell_size
+        self.entries: dict[int, tuple[Position, Color]] = {}  # agent id -> (position, color)
+        self.rank: dict[int, int] = {}  # agent id -> insertion order
+        self._next_rank = 0
+        self.buckets: dict[Color, dict[tuple[int, int], set[int]]] = {}
+        self.bounds: dict[Color, list[int]] = {}  # color -> [min bx, max bx, min by, max by] of its buckets
+
+    def bucket_of(self, pos: Position) -> tuple[int, int]:
+        return pos[0] // self.cell_size, pos[1] // self.cell_size
+
+    def update(self, agent_id: int, pos: Position, color: Color) -> None:
+        previous = self.entries.get(agent_id)
+        if previous is not None:
+            if previous == (pos, color):
+                return
+            self._remove_from_bucket(agent_id, *previous)
+        else:
+            self.rank[agent_id] = self._next_rank
+            self._next_rank += 1
+
+        self.entries[agent_id] = (pos, color)
+        bucket = self.bucket_of(pos)
+        self.buckets.setdefault(color, {}).setdefault(bucket, set()).add(agent_id)
+
+        bounds = self.bounds.get(color)
+        if bounds is None:
+            self.bounds[color] = [bucket[0], bucket[0], bucket[1], bucket[1]]
+        else:
+            bounds[0], bounds[1] = min(bounds[0], bucket[0]), max(bounds[1], bucket[0])
+            bounds[2], bounds[3] = min(bounds[2], bucket[1]), max(bounds[3], bucket[1])
+
+    def remove(self, agent_id: int) -> None:
+        previous = self.entries.pop(agent_id, None)
+        if previous is not None:
+            self._remove_from_bucket(agent_id, *previous)
+            del self.rank[agent_id]
+
+    def _remove_from_bucket(self, agent_id: int, pos: Position, color: Color) -> None:
+        bucket = self.bucket_of(pos)
+        ids = self.buckets[color][bucket]
+        ids.discard(agent_id)
+        if len(ids) == 0:
+            del self.buckets[color][bucket]
+
+    def _ring(self, center: tuple[int, int], radius: int) -> Iterator[tuple[int, int]]:
+        """Buckets at Chebyshev distance exactly `radius` of `center`."""
+        cx, cy = center
+        if radius == 0:
+            yield center
+            return
+        for bx in range(cx - radius, cx + radius + 1):
+            yield bx, cy - radius
+            yield bx, cy + radius
+        for by in range(cy - radius + 1, cy + radius):
+            yield cx - radius, by
+            yield cx + radius, by
+
+    def nearest(self, pos: Position, color: Color) -> int | None:
+        """Id of the closest agent of this color, None if there is none."""
+        buckets = self.buckets.get(color)
+        if not buckets:
+            return None
+
+        x, y = pos
+        center = self.bucket_of(pos)
+        min_bx, max_bx, min_by, max_by = self.bounds[color]
+        max_ring = max(center[0] - min_bx, max_bx - center[0], center[1] - min_by, max_by - center[1])
+
+        best: tuple[int, int] | None = None  # (distance, rank)
+        best_id = None
+        for ring in range(max_ring + 1):
+            # Agents in this ring are at least (ring - 1) * cell_size + 1 cells away
+            if best is not None and ring > 0 and (ring - 1) * self.cell_size + 1 > best[0]:
+                break
+            for bucket in self._ring(center, ring):
+                for agent_id in buckets.get(bucket, ()):
+                    (ax, ay), _ = self.entries[agent_id]
+                    candidate = (abs(x - ax) + abs(y - ay), self.rank[agent_id])
+                    if best is None or candidate < best:
+                        best, best_id = candidate, agent_id
+        return best_id
+
+    def within_radius(self, pos: Position, radius: int, color: Color | None = None) -> list[int]:
+        """Ids of the agents (of this color if given) at a Manhattan distance of at most `radius`."""
+        x, y = pos
+        min_bx, min_by = self.bucket_of((x - radius, y - radius))
+        max_bx, max_by = self.bucket_of((x + radius, y + radius))
+        colors = [color] if color is not None else list(self.buckets)
+
+        res = []
+        for c in colors:
+            buckets = self.buckets.get(c, {})
+            for bx in range(min_bx, max_bx + 1):
+                for by in range(min_by, max_by + 1):
+                    for agent_id in buckets.get((bx, by), ()):
+                        (ax, ay), _ = self.entries[agent_id]
+                        if abs(x - ax) + abs(y - ay) <= radius:
+                            res.append(agent_id)
+        return sorted(res, key=self.rank.__getitem__)
+
+    def __contains__(self, agent_id: int) -> bool:
+        return agent_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,57 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from agents.RL import RLAgent
+from utils import Color, Position
+
+if TYPE_CHECKING:
+    from agent import Agent
+    from model import RobotMission
+
+
+class StateTensor:
+    """
+    `RobotMission.to_tensor`, kept up to date after each action instead of being rebuilt from the whole grid.
+    An action only changes the cell the agent leaves and the cell it ends on (its presence, its inventory and the waste
+    lying there), so each update costs O(1) whatever the size of the grid.
+
+    Build it with `RobotMission.enable_state_tensor` once the `training_id` of the RL agents are final.
+    """
+
+    def __init__(self, model: RobotMission) -> None:
+        self.model = model
+        self.tensor = model.build_tensor()
+        self._array = self.tensor.numpy()  # same memory, cheaper to write cell by cell
+
+    @staticmethod
+    def offset(agent: Agent) -> int:
+        return len(Color) * ((agent.training_id + 2) if isinstance(agent, RLAgent) else 1)
+
+    def update(self, agent: Agent, previous_pos: Position) -> None:
+        """Called after `agent` played an action from `previous_pos`."""
+        offset = self.offset(agent)
+        x, y = agent.get_true_pos()
+
+        if previous_pos != (x, y):
+            self._array[offset : offset + 3, previous_pos[0], previous_pos[1]] = 0
+            self.update_waste(previous_pos)
+
+        self._array[offset, x, y] = 1
+        self._array[offset + 1 : offset + 3, x, y] = 0
+        for waste in agent.inventory:
+            self._array[offset + (1 if waste.color == agent.color else 2), x, y] += 1
+        self.update_waste((x, y))
+
+    def update_waste(self, pos: Position) -> None:
+        x, y = pos
+        self._array[: len(Color), x, y] = 0
+        waste = self.model.grid.get_waste_at(pos)
+        if waste is not None:
+            self._array[waste.color - 1, x, y] = 1
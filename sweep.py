@@ -0,0 +1,127 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+import hashlib
+import itertools
+import json
+import os
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any
+
+from tqdm import tqdm
+from benchmark import init_worker, play
+
+
+CACHE_VERSION = 2  # bump when the simulation changes in a way that invalidates cached curves
+
+
+def expand_grid(grid: dict[str, list[Any]]) -> list[dict[str, Any]]:
+    """
+    {"width": [10, 20], "agents_model": ["Naive", "RuleBased"]} -> the 4 configurations.
+    "agents_model" is a key of `str_to_agent` used for every color, the other keys are `RobotMission.__init__` parameters.
+    """
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def config_hash(config: dict[str, Any], seed: int, steps: int) -> str:
+    content = json.dumps({"version": CACHE_VERSION, "config": config, "seed": seed, "steps": steps}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class SweepCache:
+    """One JSON file per (configuration, seed, steps), named after the hash of its content."""
+
+    def __init__(self, directory: str = "sweeps") -> None:
+        self.directory = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> list[int] | None:
+        try:
+            with open(self.path(key), "r") as f:
+                return json.load(f)["curve"]
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, config: dict[str, Any], seed: int, curve: list[int]) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename so an interrupted sweep never leaves a truncated entry behind
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"config": config, "seed": seed, "curve": curve}, f)
+        os.replace(tmp_path, path)
+
+
+def play_config(config: dict[str, Any], seeds: list[int], steps: int) -> list[list[int]]:
+    params = dict(config)
+    agents_model = params.pop("agents_model", "RuleBased")
+    return [play(agents_model, steps, seed, **params) for seed in seeds]
+
+
+def sweep(
+    grid: dict[str, list[Any]],
+    n_seeds: int = 100,
+    steps: int = 400,
+    cache_dir: str = "sweeps",
+    n_workers: int | None = None,
+    runs_per_task: int = 25,
+) -> list[tuple[dict[str, Any], list[float]]]:
+    """
+    Plays `n_seeds` games for every configuration of the grid and returns each configuration with its mean waste count
+    after each step. Games already in the cache are not played again, so extending the grid or the number of seeds
+    only plays the missing ones.
+    """
+    cache = SweepCache(cache_dir)
+    configs = expand_grid(grid)
+    curves: list[list[list[int] | None]] = [
+        [cache.get(config_hash(config, seed, steps)) for seed in range(n_seeds)] for config in configs
+    ]
+
+    tasks = []
+    for config_idx, config in enumerate(configs):
+        missing = [seed for seed in range(n_seeds) if curves[config_idx][seed] is None]
+        for start in range(0, len(missing), runs_per_task):
+            tasks.append((config_idx, missing[start : start + runs_per_task]))
+
+    if len(tasks) > 0:
+        with ProcessPoolExecutor(n_workers or os.cpu_count() or 1, initializer=init_worker) as pool:
+            futures = {
+                pool.submit(play_config, configs[config_idx], seeds, steps): (config_idx, seeds)
+                for config_idx, seeds in tasks
+            }
+
+            with tqdm(total=sum(len(seeds) for _, seeds in tasks)) as pbar:
+                for future in as_completed(futures):
+                    config_idx, seeds = futures[future]
+                    for seed, curve in zip(seeds, future.result()):
+                        cache.put(config_hash(configs[config_idx], seed, steps), configs[config_idx], seed, curve)
+                        curves[config_idx][seed] = curve
+                    pbar.update(len(seeds))
+
+    return [
+        (config, [sum(values) / n_seeds for values in zip(*config_curves)])  # type: ignore
+        for config, config_curves in zip(configs, curves)
+    ]
+
+
+if __name__ == "__main__":
+    results = sweep(
+        {
+            "agents_model": ["Naive", "RuleBased", "CommunicationRuleBased"],
+            "n_green_agents": [3, 6],
+            "n_green_wastes": [12, 24],
+        },
+        n_seeds=50,
+        steps=200,
+    )
+    for config, curve in results:
+        cleared_at = next((step for step, count in enumerate(curve) if count == 0), None)
+        print(f"{config} -> {curve[-1]:.2f} wastes left, cleared at step {cleared_at}")
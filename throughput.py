@@ -0,0 +1,165 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import torch
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from model import RobotMission
+from agents.all_agents import str_to_agent
+from utils import Color
+
+
+@dataclass
+class Scenario:
+    name: str
+    width: int
+    height: int
+    n_agents: tuple[int, int, int]  # green, yellow, red
+    n_wastes: tuple[int, int, int]  # green, yellow, red
+    grid_backends: tuple[str, ...] = ("mesa", "array")  # the backends this scenario is measured on
+
+    def model_params(self) -> dict[str, Any]:
+        return {
+            "width": self.width,
+            "height": self.height,
+            **{f"n_{color.name.lower()}_agents": n for color, n in zip(Color, self.n_agents)},
+            **{f"n_{color.name.lower()}_wastes": n for color, n in zip(Color, self.n_wastes)},
+        }
+
+
+scenarios = [
+    Scenario("10x10", 10, 10, (3, 2, 2), (12, 6, 3)),
+    Scenario("50x50", 50, 50, (15, 10, 10), (60, 30, 15)),
+    Scenario("100x100", 100, 100, (60, 40, 40), (240, 120, 60)),
+    # A step of the mesa grid takes ~0.4s at this size, only the array grid is measured
+    Scenario("200x200", 200, 200, (150, 100, 100), (600, 300, 150), grid_backends=("array",)),
+]
+
+METRICS = ["construct_s", "step_s", "run_s"]
+
+
+def measure(
+    scenario: Scenario, agents_model: str, grid_backend: str, steps: int, repeats: int, seed: int
+) -> dict[str, float]:
+    """Best of `repeats` for the construction, the median `step()` and `run(steps)` of a model."""
+    params = {
+        **scenario.model_params(),
+        **{f"{color.name.lower()}_agent_model": agents_model for color in Color},
+        "grid_backend": grid_backend,
+        "seed": seed,
+    }
+
+    construct, step, run = [], [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model = RobotMission(**params)
+        construct.append(time.perf_counter() - start)
+
+        step_times = []
+        for _ in range(steps):
+            start = time.perf_counter()
+            model.step()
+            step_times.append(time.perf_counter() - start)
+        step.append(statistics.median(step_times))
+
+        model = RobotMission(**params)
+        start = time.perf_counter()
+        model.run(steps)
+        run.append(time.perf_counter() - start)
+
+    return {"construct_s": min(construct), "step_s": min(step), "run_s": min(run), "steps_per_s": 1 / min(step)}
+
+
+def run_suite(
+    scenario_names: list[str], agents_models: list[str], grid_backends: list[str], steps: int, repeats: int, seed: int
+) -> dict[str, Any]:
+    results = {}
+    for scenario in [scenario for scenario in scenarios if scenario.name in scenario_names]:
+        for agents_model in agents_models:
+            for grid_backend in [grid_backend for grid_backend in grid_backends if grid_backend in scenario.grid_backends]:
+                key = f"{scenario.name}/{agents_model}/{grid_backend}"
+                results[key] = measure(scenario, agents_model, grid_backend, steps, repeats, seed)
+                print(
+                    f"{key:<45} construct {results[key]['construct_s']:8.3f}s   step {1e3 * results[key]['step_s']:9.2f}ms"
+                    f"   run({steps}) {results[key]['run_s']:8.3f}s",
+                    flush=True,
+                )
+
+    return {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "steps": steps,
+            "repeats": repeats,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Prints the ratio current / baseline of every metric and returns the regressions larger than `tolerance`."""
+    regressions = []
+    print(f"\n{'benchmark':<45} " + " ".join(f"{metric:>12}" for metric in METRICS))
+    for key, result in current["results"].items():
+        if key not in baseline["results"]:
+            continue
+
+        ratios = [result[metric] / baseline["results"][key][metric] for metric in METRICS]
+        print(f"{key:<45} " + " ".join(f"{ratio:>11.2f}x" for ratio in ratios))
+        for metric, ratio in zip(METRICS, ratios):
+            if ratio > 1 + tolerance:
+                regressions.append(f"{key} {metric}: {ratio:.2f}x slower than the baseline")
+
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measures the simulation speed of RobotMission.")
+    parser.add_argument("--scenarios", default=",".join(scenario.name for scenario in scenarios))
+    parser.add_argument("--agents", default=",".join(str_to_agent.keys()))
+    parser.add_argument("--backends", default="mesa,array", help="Comma separated grid backends (mesa, array)")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="throughput.json", help="Where to save the results")
+    parser.add_argument("--baseline", help="Results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before reporting a regression")
+    args = parser.parse_args()
+
+    # Single threaded torch, so that the DQN agents are measured the same way on every machine
+    torch.set_num_threads(1)
+
+    current = run_suite(
+        args.scenarios.split(","), args.agents.split(","), args.backends.split(","), args.steps, args.repeats, args.seed
+    )
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=4)
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+
+    regressions = compare(current, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,147 +4,27 @@ Members: Aymeric Conti, Pierre Jourdin
 Date: 15/03/2025
 """
 
+import os
 import random
 import torch
-import torch.nn.functional as F
 import torch.optim as optim
 import wandb
 
 from typing import Any
 from tqdm import tqdm
 
-from action import Drop, Merge
 from agents.RL import RLAgent
 from model import RobotMission, default_agents_params
 from network import MemoryNetwork, MixingNetwork
+from record import Recorder
+from replay_memory import Batch, Game, PrioritizedReplayMemory, ReplayMemory, Transition
 from utils import Color
+from vec_env import VecRobotMission, compute_bonus_reward, compute_reward, get_observations
 
 
 actions_to_str = {0: "Wait", 1: "Move UP", 2: "Move DOWN", 3: "Move LEFT", 4: "Move RIGHT", 5: "Pick", 6: "Drop", 7: "Merge"}
 
 
-class Transition:
-    def __init__(
-        self,
-        observations: torch.Tensor,
-        state: torch.Tensor,
-        hiddens: tuple[torch.Tensor, torch.Tensor],
-        actions: torch.Tensor,
-        reward: torch.Tensor,
-        done: bool,
-    ):
-        self.observations = observations
-        self.state = state
-        self.hiddens = hiddens
-        self.actions = actions
-        self.reward = reward
-        self.done = done
-
-
-class Game:
-    def __init__(self, transitions: list[Transition], final_observation: torch.Tensor, final_state: torch.Tensor) -> None:
-        self.observations = torch.stack([transition.observations for transition in transitions] + [final_observation])
-        self.state = torch.stack([transition.state for transition in transitions] + [final_state])
-        self.hiddens = (
-            torch.stack([transition.hiddens[0] for transition in transitions], dim=1),
-            torch.stack([transition.hiddens[1] for transition in transitions], dim=1),
-        )
-        self.actions = torch.stack([transition.actions for transition in transitions])
-        self.rewards = torch.stack([transition.reward for transition in transitions])
-        self.done = torch.tensor([transition.done for transition in transitions], dtype=torch.float32)
-        self.length = len(transitions)
-
-
-class Batch:
-    observations: torch.Tensor
-    states: torch.Tensor
-    actions: torch.Tensor
-    next_observations: torch.Tensor
-    next_states: torch.Tensor
-    rewards: torch.Tensor
-    dones: torch.Tensor
-
-    def __init__(self, games: list[Game], seq_size: int) -> None:
-        assert seq_size <= 100, "Sequence size must be less than or equal to 100"
-
-        games = [game for game in games if game.length >= seq_size]
-        start_idxs = [random.randint(0, game.length - seq_size) for game in games]
-
-        all_observations = torch.stack(
-            [game.observations[start_idx : start_idx + seq_size + 1] for start_idx, game in zip(start_idxs, games)]
-        ).transpose(1, 2)
-        all_states = torch.stack(
-            [game.state[start_idx : start_idx + seq_size + 1] for start_idx, game in zip(start_idxs, games)]
-        ).transpose(1, 2)
-
-        self.observations = all_observations[:, :, :-1]
-        self.states = all_states[:, :, :-1]
-        self.hiddens = (
-            torch.stack([game.hiddens[0][:, start_idx] for start_idx, game in zip(start_idxs, games)], dim=1),
-            torch.stack([game.hiddens[1][:, start_idx] for start_idx, game in zip(start_idxs, games)], dim=1),
-        )
-        self.actions = torch.stack(
-            [game.actions[start_idx : start_idx + seq_size] for start_idx, game in zip(start_idxs, games)]
-        ).transpose(1, 2)
-        self.next_observations = all_observations[:, :, 1:]
-        self.next_states = all_states[:, :, 1:]
-        self.next_hiddens = (
-            torch.stack([game.hiddens[0][:, start_idx + 1] for start_idx, game in zip(start_idxs, games)], dim=1),
-            torch.stack([game.hiddens[1][:, start_idx + 1] for start_idx, game in zip(start_idxs, games)], dim=1),
-        )
-        self.rewards = torch.stack(
-            [game.rewards[start_idx : start_idx + seq_size] for start_idx, game in zip(start_idxs, games)]
-        ).transpose(1, 2)
-        self.dones = torch.stack([game.done[start_idx : start_idx + seq_size] for start_idx, game in zip(start_idxs, games)])
-
-
-class ReplayMemory:
-    def __init__(self, capacity: int):
-        self.capacity = capacity
-        self.memory: list[Game] = []
-        self.position = 0
-
-    def push(self, game: Game):
-        if len(self.memory) < self.capacity:
-            self.memory.append(game)
-        else:
-            self.memory[self.position] = game
-        self.position = (self.position + 1) % self.capacity
-
-    def sample(self, batch_size: int, seq_size: int) -> Batch:
-        return Batch(random.sample(self.memory, batch_size), seq_size)
-
-    def __len__(self):
-        return len(self.memory)
-
-
-def get_observations(rl_agents: list[RLAgent]) -> torch.Tensor:
-    return torch.stack([agent.knowledge.to_tensor() for agent in rl_agents])
-
-
-def compute_reward(model: RobotMission, rl_agents: list[RLAgent]) -> torch.Tensor:
-    rewards = torch.zeros((len(rl_agents),))
-    for agent in rl_agents:
-        rewards[agent.training_id] = int(isinstance(agent.action, Merge))
-
-        if agent.color == Color.RED and isinstance(agent.action, Drop) and agent.get_true_pos() == model.dump_pos:
-            rewards[agent.training_id] += 1
-
-    return rewards
-
-
-def compute_bonus_reward(model: RobotMission, rl_agents: list[RLAgent]) -> torch.Tensor:
-    rewards = torch.zeros((len(rl_agents),))
-
-    for agent in rl_agents:
-        if agent.color == Color.RED and len(agent.inventory) > 0:
-            x, y = agent.get_true_pos()
-            dist_to_dump = (x - model.dump_pos[0]) ** 2 + (y - model.dump_pos[1]) ** 2
-            rewards[agent.training_id] += 1 / (dist_to_dump + 1)
-
-    return rewards
-
-
 def play(
     memory: ReplayMemory,
     green_net: MemoryNetwork,
@@ -170,11 +50,14 @@ def play(
     rl_agents = [agent for agent in model.get_agents() if isinstance(agent, RLAgent)]
     n_rl_agents = len(rl_agents)
 
+    recorder = Recorder(f"simulations/{epoch}.jsonl.gz", model) if save else None
+
     transitions: list[Transition] = []
 
     rl_agents.sort(key=lambda a: a.color)
     for i, agent in enumerate(rl_agents):
         agent.training_id = i
+    model.enable_state_tensor()
 
     for agent in rl_agents:
         agent.knowledge.update(agent.perception)
@@ -258,12 +141,115 @@ def play(
     game = Game(transitions, observations, state)
     memory.push(game)
 
-    if save:
-        model.save(f"simulations/{epoch}.json")
+    if recorder is not None:
+        recorder.close()
 
     return {"reward": total_reward.sum(), "actions_ratio": actions_ratio / (game.length * n_rl_agents)}
 
 
+class VecRollout:
+    """
+    Plays the games of a `VecRobotMission` for `play`-like rollouts: each step, one forward per color covers
+    the agents of this color in every environment. Each finished game is pushed to the replay memory.
+    """
+
+    def __init__(
+        self, vec_env: VecRobotMission, green_net: MemoryNetwork, yellow_net: MemoryNetwork, red_net: MemoryNetwork
+    ) -> None:
+        self.vec_env = vec_env
+        self.nets = {Color.GREEN: green_net, Color.YELLOW: yellow_net, Color.RED: red_net}
+        self.hiddens = {
+            color: net.init_hidden(vec_env.n_envs * vec_env.n_agents_by_color[color]) for color, net in self.nets.items()
+        }
+        self.observations = vec_env.observations()
+        self.states = vec_env.states()
+        self.transitions: list[list[Transition]] = [[] for _ in range(vec_env.n_envs)]
+        self.total_rewards = torch.zeros((vec_env.n_envs,))
+
+    def agents_hiddens(self) -> tuple[torch.Tensor, torch.Tensor]:
+        """Hidden states of every agent, (num_lstm_layers, n_envs, n_agents, hidden_size) each."""
+        n_envs = self.vec_env.n_envs
+        return (
+            torch.cat([hidden.view(hidden.size(0), n_envs, -1, hidden.size(-1)) for hidden, _ in self.hiddens.values()], 2),
+            torch.cat([cell.view(cell.size(0), n_envs, -1, cell.size(-1)) for _, cell in self.hiddens.values()], 2),
+        )
+
+    def select_actions(self, epsilon: float) -> torch.Tensor:
+        vec_env = self.vec_env
+        actions = torch.randint(0, 8, (vec_env.n_envs, vec_env.n_agents), dtype=torch.int64)
+        can_dump = vec_env.can_dump()
+
+        for color, net in self.nets.items():
+            agent_slice = vec_env.colors_slice(color)
+            observations = self.observations[:, agent_slice].reshape(-1, 1, net.input_size)
+            with torch.no_grad():
+                q_values, self.hiddens[color] = net(observations, self.hiddens[color])
+            q_values = q_values.view(vec_env.n_envs, -1, 8)
+
+            if color == Color.RED:
+                q_values[..., 6] = torch.where(can_dump[:, agent_slice], float("inf"), -float("inf"))
+
+            random_mask = torch.rand(q_values.shape[:2]) < epsilon
+            actions[:, agent_slice] = torch.where(random_mask, actions[:, agent_slice], q_values.argmax(-1))
+
+        return actions
+
+    def reset_hiddens(self, env_idx: int) -> None:
+        for color in Color:
+            agent_slice = self.vec_env.colors_slice(color)
+            n_color = agent_slice.stop - agent_slice.start
+            for hidden in self.hiddens[color]:
+                hidden[:, env_idx * n_color : (env_idx + 1) * n_color] = 0
+
+    def collect(self, memory: ReplayMemory, epsilon: float, n_steps: int) -> dict[str, Any]:
+        """Plays `n_steps` steps of every environment, games carry over from one call to the next."""
+        vec_env = self.vec_env
+        finished_rewards = []
+        actions_count = torch.zeros((8,))
+
+        for _ in range(n_steps):
+            hiddens = self.agents_hiddens()
+            actions = self.select_actions(epsilon)
+            actions_count += torch.bincount(actions.flatten(), minlength=8)
+
+            observations, states, rewards, dones, infos = vec_env.step(actions)
+            self.total_rewards += rewards.sum(1)
+
+            for env_idx in range(vec_env.n_envs):
+                self.transitions[env_idx].append(
+                    Transition(
+                        self.observations[env_idx],
+                        self.states[env_idx],
+                        (hiddens[0][:, env_idx], hiddens[1][:, env_idx]),
+                        actions[env_idx],
+                        rewards[env_idx],
+                        done=bool(dones[env_idx]),
+                    )
+                )
+
+                if dones[env_idx]:
+                    memory.push(
+                        Game(
+                            self.transitions[env_idx],
+                            infos["final_observations"][env_idx],
+                            infos["final_states"][env_idx],
+                        )
+                    )
+                    finished_rewards.append(self.total_rewards[env_idx].item())
+                    self.transitions[env_idx] = []
+                    self.total_rewards[env_idx] = 0
+                    self.reset_hiddens(env_idx)
+
+            self.observations = observations
+            self.states = states
+
+        return {
+            "reward": sum(finished_rewards) / len(finished_rewards) if finished_rewards else 0.0,
+            "actions_ratio": actions_count / actions_count.sum(),
+            "n_games": len(finished_rewards),
+        }
+
+
 def select_best_action(
     model: RobotMission,
     network: MemoryNetwork,
@@ -306,11 +292,18 @@ def train(
     batch_size: int = 128,
     gamma: float = 0.9,
     seq_size: int = 50,
+    burn_in: int = 0,
 ) -> dict[str, float]:
+    """
+    One QMIX update on `batch_size` sequences of `seq_size` steps, preceded by `burn_in` steps which only rebuild the
+    hidden states of the agents. The loss is averaged over the steps of the mask of the batch, each sequence weighted by
+    its importance-sampling weight, and the TD errors of the sequences give their new priorities in the memory.
+    """
     if len(memory) < batch_size:
         return {"loss": 0, "q_values": 0}
 
-    batch = memory.sample(batch_size, seq_size)
+    batch = memory.sample(batch_size, seq_size, burn_in)
+    batch_size, seq_size = batch.mask.shape
 
     n_agents = n_green_agents + n_yellow_agents + n_red_agents
     state_size = 3 * (n_agents + 2)
@@ -324,7 +317,7 @@ def train(
     yellow_q_values = get_q_values(yellow_net, batch, yellow_slice, batch_size, seq_size)
     red_q_values = get_q_values(red_net, batch, red_slice, batch_size, seq_size)
     q_values = (
-        torch.cat([green_q_values, yellow_q_values, red_q_values], dim=1).gather(-1, batch.actions.unsqueeze(-1)).squeeze()
+        torch.cat([green_q_values, yellow_q_values, red_q_values], dim=1).gather(-1, batch.actions.unsqueeze(-1)).squeeze(-1)
     )
 
     q_total = mixing_net(
@@ -344,12 +337,15 @@ def train(
 
     target_q_total = batch.rewards.sum(1) + gamma * next_q_total * (1 - batch.dones)
 
-    loss = F.mse_loss(q_total, target_q_total)
+    td_errors = (q_total - target_q_total) * batch.mask
+    loss = (batch.weights[:, None] * td_errors**2).sum() / batch.mask.sum()
     optimizer.zero_grad()
     loss.backward()
     optimizer.step()
     scheduler.step()
 
+    memory.update_priorities(batch.indices, td_errors.detach().abs(), batch.mask)
+
     return {
         "loss": loss.item(),
         "q_values": q_values.mean().item(),
@@ -384,11 +380,52 @@ def get_next_q_values(
     )
 
 
-def main(use_wandb: bool = True):
+def save_checkpoint(
+    checkpoint_dir: str,
+    epoch: int,
+    epsilon: float,
+    networks: dict[str, torch.nn.Module],
+    optimizer: optim.Optimizer,
+    scheduler: optim.lr_scheduler.LRScheduler,
+    memory: ReplayMemory,
+) -> None:
+    """Saves everything `main` needs to resume the training at `epoch`, the replay memory in checkpoint_dir/memory."""
+    memory.save()
+    checkpoint = {
+        "epoch": epoch,
+        "epsilon": epsilon,
+        "networks": {name: network.state_dict() for name, network in networks.items()},
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict(),
+    }
+    path = os.path.join(checkpoint_dir, "checkpoint.pth")
+    torch.save(checkpoint, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+
+def main(use_wandb: bool = True, n_envs: int = 1, prioritized: bool = True, checkpoint_dir: str | None = "checkpoints"):
+    """
+    Args:
+        n_envs: Number of games played at once by a `VecRollout` between two trainings (1 plays them one by one).
+        prioritized: Sample the training sequences by TD error (`PrioritizedReplayMemory`) instead of uniformly.
+        checkpoint_dir: Where the replay memory is memory-mapped and the training is checkpointed every 1000 epochs.
+            If it holds a checkpoint, the training resumes from it with its replay memory, without a new warm-up.
+            None keeps the replay memory in RAM and saves no checkpoint.
+    """
     if use_wandb:
         wandb.init(project="robot_mission")
 
-    memory = ReplayMemory(10000)
+    seq_size = 50
+    memory_dir = None if checkpoint_dir is None else os.path.join(checkpoint_dir, "memory")
+    resume = checkpoint_dir is not None and os.path.exists(os.path.join(checkpoint_dir, "checkpoint.pth"))
+    memory: ReplayMemory
+    if resume:
+        assert memory_dir is not None
+        memory = (PrioritizedReplayMemory if prioritized else ReplayMemory).load(memory_dir)
+    elif prioritized:
+        memory = PrioritizedReplayMemory(10000, window=seq_size, directory=memory_dir)
+    else:
+        memory = ReplayMemory(10000, directory=memory_dir)
 
     green_net = MemoryNetwork(26)
     green_net.load_state_dict(torch.load("networks/greedy_green90000.pth"))
@@ -424,13 +461,38 @@ def main(use_wandb: bool = True):
     agent_params[Color.YELLOW]["network"] = yellow_net
     agent_params[Color.RED]["network"] = red_net
 
-    pbar = tqdm(range(epochs))
+    rollout = None
+    if n_envs > 1:
+        vec_env = VecRobotMission(n_envs, n_green_agents, n_yellow_agents, n_red_agents, agent_params)
+        rollout = VecRollout(vec_env, green_net, yellow_net, red_net)
 
     epsilon_start = 0.01
     epsilon_end = 0.01
     epsilon_epochs = epochs * 0.3
 
     epsilon = epsilon_start
+    beta_start = 0.4
+
+    networks = {
+        "green": green_net,
+        "yellow": yellow_net,
+        "red": red_net,
+        "green_target": green_target_net,
+        "yellow_target": yellow_target_net,
+        "red_target": red_target_net,
+        "mix": mix_network,
+    }
+    start_epoch = 0
+    if resume:
+        assert checkpoint_dir is not None
+        checkpoint = torch.load(os.path.join(checkpoint_dir, "checkpoint.pth"))
+        for name, network in networks.items():
+            network.load_state_dict(checkpoint["networks"][name])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        scheduler.load_state_dict(checkpoint["scheduler"])
+        start_epoch, epsilon = checkpoint["epoch"], checkpoint["epsilon"]
+
+    pbar = tqdm(range(start_epoch, epochs))
     for i in pbar:
         if i % 100 == 0:
             green_target_net.load_state_dict(green_net.state_dict())
@@ -442,23 +504,33 @@ def main(use_wandb: bool = True):
             torch.save(yellow_net.state_dict(), f"networks/greedy_yellow{i}.pth")
             torch.save(red_net.state_dict(), f"networks/greedy_red{i}.pth")
             torch.save(mix_network.state_dict(), f"networks/greedy_mix{i}.pth")
+            if checkpoint_dir is not None:
+                save_checkpoint(checkpoint_dir, i, epsilon, networks, optimizer, scheduler, memory)
 
         if i <= epsilon_epochs:
             epsilon -= (epsilon_start - epsilon_end) / epsilon_epochs
 
-        results = play(
-            memory,
-            green_net,
-            yellow_net,
-            red_net,
-            epsilon,
-            epoch=i,
-            agent_params=agent_params,
-            n_green_agents=n_green_agents,
-            n_yellow_agents=n_yellow_agents,
-            n_red_agents=n_red_agents,
-            save=i % 400 == 0,
-        )
+        if isinstance(memory, PrioritizedReplayMemory):
+            # Importance-sampling correction annealed to a full one by the end of the training
+            memory.beta = beta_start + (1 - beta_start) * i / epochs
+
+        save = i % 400 == 0
+        if rollout is not None and not save:
+            results = rollout.collect(memory, epsilon, n_steps=vec_env.max_steps)
+        else:
+            results = play(
+                memory,
+                green_net,
+                yellow_net,
+                red_net,
+                epsilon,
+                epoch=i,
+                agent_params=agent_params,
+                n_green_agents=n_green_agents,
+                n_yellow_agents=n_yellow_agents,
+                n_red_agents=n_red_agents,
+                save=save,
+            )
 
         if i < warmup_epochs:
             continue
@@ -478,6 +550,7 @@ def main(use_wandb: bool = True):
             scheduler,
             memory,
             gamma=0.9,
+            seq_size=seq_size,
         )
         actions_ratio = results["actions_ratio"]
         actions_ratio = {actions_to_str[i]: ratio.item() for i, ratio in enumerate(actions_ratio)}
@@ -0,0 +1,163 @@
+"""
+Group: 14
+Members: Aymeric Conti, Pierre Jourdin
+Date: 18/10/2026
+"""
+
+import random
+import torch
+
+from typing import Any
+
+from action import Drop, Merge
+from agents.RL import RLAgent
+from model import RobotMission, default_agents_params
+from observation import N_FEATURES, build_observations
+from utils import Color
+
+
+def get_observations(rl_agents: list[RLAgent], out: torch.Tensor | None = None) -> torch.Tensor:
+    return build_observations([agent.knowledge for agent in rl_agents], out)
+
+
+def compute_reward(model: RobotMission, rl_agents: list[RLAgent]) -> torch.Tensor:
+    rewards = torch.zeros((len(rl_agents),))
+    for agent in rl_agents:
+        rewards[agent.training_id] = int(isinstance(agent.action, Merge))
+
+        if agent.color == Color.RED and isinstance(agent.action, Drop) and agent.get_true_pos() == model.dump_pos:
+            rewards[agent.training_id] += 1
+
+    return rewards
+
+
+def compute_bonus_reward(model: RobotMission, rl_agents: list[RLAgent]) -> torch.Tensor:
+    rewards = torch.zeros((len(rl_agents),))
+
+    for agent in rl_agents:
+        if agent.color == Color.RED and len(agent.inventory) > 0:
+            x, y = agent.get_true_pos()
+            dist_to_dump = (x - model.dump_pos[0]) ** 2 + (y - model.dump_pos[1]) ** 2
+            rewards[agent.training_id] += 1 / (dist_to_dump + 1)
+
+    return rewards
+
+
+class VecRobotMission:
+    """
+    `n_envs` independent missions played by DQN agents, stepped in lockstep for RL rollouts.
+
+    Agents are ordered by color (green, yellow then red) in every environment, so `observations()[:, colors_slice(c)]`
+    holds the observations of all the agents of color c in all the environments and one network forward covers them.
+    An environment is over when all its wastes are dumped or after `max_steps` steps:
+    the bonus reward of `compute_bonus_reward` is added to its last reward and it is reset automatically.
+    """
+
+    def __init__(
+        self,
+        n_envs: int,
+        n_green_agents: int = 3,
+        n_yellow_agents: int = 2,
+        n_red_agents: int = 2,
+        agent_params: dict[Color, dict[str, Any]] = default_agents_params,
+        max_steps: int = 200,
+        **model_params,
+    ) -> None:
+        """
+        Args:
+            agent_params: Passed to every `RLAgent`, give them a "network" to avoid loading one per agent and per reset.
+            model_params: Other `RobotMission` parameters (the grid uses the "array" backend unless told otherwise).
+        """
+        self.n_envs = n_envs
+        self.max_steps = max_steps
+        self.n_agents_by_color = {Color.GREEN: n_green_agents, Color.YELLOW: n_yellow_agents, Color.RED: n_red_agents}
+        self.n_agents = n_green_agents + n_yellow_agents + n_red_agents
+        self.model_params = {
+            "grid_backend": "array",
+            **model_params,
+            **{f"{color.name.lower()}_agent_model": "DQN" for color in Color},
+            **{f"n_{color.name.lower()}_agents": n for color, n in self.n_agents_by_color.items()},
+            "agent_params": agent_params,
+        }
+
+        self.envs: list[RobotMission] = []
+        self.rl_agents: list[list[RLAgent]] = []
+        for _ in range(n_envs):
+            model, rl_agents = self.new_env()
+            self.envs.append(model)
+            self.rl_agents.append(rl_agents)
+        self.episode_steps = [0] * n_envs
+
+    def colors_slice(self, color: Color) -> slice:
+        start = sum(n for c, n in self.n_agents_by_color.items() if c < color)
+        return slice(start, start + self.n_agents_by_color[color])
+
+    def new_env(self) -> tuple[RobotMission, list[RLAgent]]:
+        model = RobotMission(**self.model_params)
+        rl_agents = [agent for agent in model.get_agents() if isinstance(agent, RLAgent)]
+        rl_agents.sort(key=lambda a: a.color)
+        for i, agent in enumerate(rl_agents):
+            agent.training_id = i
+            agent.knowledge.update(agent.perception)
+        model.enable_state_tensor()
+        return model, rl_agents
+
+    def reset_env(self, env_idx: int) -> None:
+        self.envs[env_idx], self.rl_agents[env_idx] = self.new_env()
+        self.episode_steps[env_idx] = 0
+
+    def observations(self, out: torch.Tensor | None = None) -> torch.Tensor:
+        """(n_envs, n_agents, 26) `AllKnowledge.to_tensor` of every agent, written into `out` if given."""
+        if out is None:
+            out = torch.empty((self.n_envs, self.n_agents, N_FEATURES))
+        knowledges = [agent.knowledge for rl_agents in self.rl_agents for agent in rl_agents]
+        build_observations(knowledges, out.view(-1, N_FEATURES))
+        return out
+
+    def states(self) -> torch.Tensor:
+        """(n_envs, 3 * (n_agents + 2), width, height) `RobotMission.to_tensor` of every environment."""
+        return torch.stack([model.to_tensor(copy=False) for model in self.envs])
+
+    def can_dump(self) -> torch.Tensor:
+        """(n_envs, n_agents) whether each agent stands on the dump with a waste in its inventory."""
+        return torch.tensor(
+            [
+                [len(agent.inventory) > 0 and agent.get_true_pos() == model.dump_pos for agent in rl_agents]
+                for model, rl_agents in zip(self.envs, self.rl_agents)
+            ]
+        )
+
+    def step(self, actions: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, dict]:
+        """
+        Plays one step of every environment, `actions` is (n_envs, n_agents) in the order of `train.actions_to_str`.
+
+        Returns (observations, states, rewards, dones, infos) where rewards is (n_envs, n_agents) and dones is (n_envs,).
+        The observations and states of a finished environment are the ones of its new episode,
+        the last ones of the finished episode are in infos["final_observations"][env_idx] and infos["final_states"][env_idx].
+        """
+        assert actions.shape == (self.n_envs, self.n_agents), f"Expected actions of shape {(self.n_envs, self.n_agents)}"
+
+        rewards = torch.zeros((self.n_envs, self.n_agents))
+        dones = torch.zeros((self.n_envs,), dtype=torch.bool)
+        infos: dict[str, dict[int, torch.Tensor]] = {"final_observations": {}, "final_states": {}}
+
+        for env_idx, (model, rl_agents) in enumerate(zip(self.envs, self.rl_agents)):
+            agents = model.get_agents()
+            random.shuffle(agents)
+            for agent in agents:
+                if isinstance(agent, RLAgent):
+                    agent.step_from_choice(int(actions[env_idx, agent.training_id]))
+                else:
+                    agent.step()
+            model.step_idx += 1
+            self.episode_steps[env_idx] += 1
+
+            rewards[env_idx] = compute_reward(model, rl_agents)
+            if model.is_done() or self.episode_steps[env_idx] >= self.max_steps:
+                rewards[env_idx] += compute_bonus_reward(model, rl_agents)
+                dones[env_idx] = True
+                infos["final_observations"][env_idx] = get_observations(rl_agents)
+                infos["final_states"][env_idx] = model.to_tensor(copy=False)
+                self.reset_env(env_idx)
+
+        return self.observations(), self.states(), rewards, dones, infos